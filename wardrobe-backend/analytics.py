@@ -0,0 +1,367 @@
+"""
+Daily rental rollups for the /admin/analytics reports
+
+`rental_stats_daily` holds one row per (dimension, day, value): for each
+category, size and brand, how many rentals were checked out and returned
+that day, with running sums for rental length, lateness and lead time
+(request_date to checkout). Routes that check items out or take them back
+add their rentals' counters with an upsert inside the same transaction
+(record()), so the rollups commit or roll back with the rentals
+themselves. Reports then read O(days x values) rollup rows instead of
+scanning the rental history.
+
+Counters land on the day of the event: checkouts and lead time on the
+checkout date, returns, rental days and lateness on the actual return
+date (or the checkout date, for a booking given back before it started).
+Rentals without a checkout date are left out. Each rental keeps the
+item's category, size and brand from checkout (rentals.item_category,
+item_size, item_brand), and its return is filed under those too, so
+editing an item while it is out can't leave a checkout without its
+return.
+
+`rental_stats_open` keeps checkouts minus returns per value over all
+days, updated by the same upserts. Utilization needs how many rentals
+were out when its range starts; that is the running total minus what
+changed from `start` on, so it costs the days since `start`, not the
+whole history.
+
+migrate.rebuild_rollups() recomputes both from `rentals` with
+rebuild_statements(), in primary-key chunks; the migration that adds the
+tables runs it, and so do the seed and benchmark data scripts after they
+load rentals.
+"""
+from datetime import timedelta
+
+from sqlalchemy import func, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+from models import Item, Rental, RentalStatsDaily, RentalStatsOpen
+
+DIMENSIONS = ("category", "size", "brand")
+# Where a rental keeps each dimension's value from checkout
+RENTAL_COLUMNS = ("item_category", "item_size", "item_brand")
+COUNTERS = ("checkouts", "returns", "rental_days", "late_returns", "late_days", "lead_count", "lead_days")
+KEY = ("dimension", "day", "value")
+
+
+# ---------- Keeping the rollups current ----------
+
+def checkout_counters(checkout_date, request_date=None):
+    counters = {"checkouts": 1}
+    if request_date is not None:
+        counters["lead_count"] = 1
+        counters["lead_days"] = (checkout_date - request_date).days
+    return counters
+
+
+def return_counters(checkout_date, expected_return_date, returned):
+    counters = {"returns": 1, "rental_days": (returned - checkout_date).days}
+    if expected_return_date is not None and returned > expected_return_date:
+        counters["late_returns"] = 1
+        counters["late_days"] = (returned - expected_return_date).days
+    return counters
+
+
+def checkout_event(values, checkout_date, request_date=None):
+    """(values, day, counters) for a checkout, or None without a checkout date"""
+    if checkout_date is None:
+        return None
+    return values, checkout_date, checkout_counters(checkout_date, request_date)
+
+
+def return_event(values, checkout_date, expected_return_date, returned):
+    """(values, day, counters) for a return; None if the checkout was never counted"""
+    if checkout_date is None:
+        return None
+    returned = max(returned, checkout_date)
+    return values, returned, return_counters(checkout_date, expected_return_date, returned)
+
+
+async def item_values(session, item_ids):
+    """Each item's (category, size, brand) as the rollups file it, "" for none"""
+    rows = await session.execute(
+        select(Item.item_id, *[getattr(Item, name) for name in DIMENSIONS])
+        .where(Item.item_id.in_(set(item_ids)))
+    )
+    return {row[0]: tuple(value or "" for value in row[1:]) for row in rows}
+
+
+def rental_columns(values):
+    """Rental column values that keep `values` for the return"""
+    return dict(zip(RENTAL_COLUMNS, values)) if values is not None else {}
+
+
+async def rental_values(session, rentals):
+    """The values each rental was checked out under, by rental_id
+
+    `rentals` need rental_id, item_id and the RENTAL_COLUMNS. Rentals
+    written without them (by an older API process) fall back to their
+    item's current values, as rebuild_statements() does.
+    """
+    missing = {rental.item_id for rental in rentals if rental.item_category is None}
+    current = await item_values(session, missing) if missing else {}
+    return {
+        rental.rental_id: (
+            current.get(rental.item_id) if rental.item_category is None
+            else tuple(getattr(rental, name) for name in RENTAL_COLUMNS)
+        )
+        for rental in rentals
+    }
+
+
+def upsert(dialect, model, key, counters):
+    """INSERT ... ON CONFLICT that adds to the counters of an existing row"""
+    insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+    table = model.__table__
+    statement = insert(table)
+    return statement.on_conflict_do_update(
+        index_elements=list(key),
+        set_={name: table.c[name] + statement.excluded[name] for name in counters},
+    )
+
+
+async def record(session, events):
+    """Add checkout/return events to the rollups in the caller's transaction"""
+    totals = {}
+    for event in events:
+        if event is None or event[0] is None:
+            continue
+        values, day, counters = event
+        for dimension, value in zip(DIMENSIONS, values):
+            row = totals.setdefault((dimension, day, value), dict.fromkeys(COUNTERS, 0))
+            for name, amount in counters.items():
+                row[name] += amount
+    if not totals:
+        return
+    out = {}
+    for (dimension, _, value), counters in totals.items():
+        out[dimension, value] = out.get((dimension, value), 0) + counters["checkouts"] - counters["returns"]
+    dialect = session.bind.dialect.name
+    # Sorted, so concurrent writers take the row locks in the same order
+    await session.execute(
+        upsert(dialect, RentalStatsDaily, KEY, COUNTERS),
+        [dict(zip(KEY, key), **counters) for key, counters in sorted(totals.items())],
+    )
+    await session.execute(
+        upsert(dialect, RentalStatsOpen, ("dimension", "value"), ("outstanding",)),
+        [{"dimension": dimension, "value": value, "outstanding": change} for (dimension, value), change in sorted(out.items())],
+    )
+
+
+# ---------- Rebuilding from the rental history ----------
+
+def day_difference(dialect, later, earlier):
+    if dialect == "postgresql":
+        return f"({later} - {earlier})"
+    return f"CAST(julianday({later}) - julianday({earlier}) AS INTEGER)"
+
+
+def later_of(dialect, first, second):
+    return f"{'greatest' if dialect == 'postgresql' else 'max'}({first}, {second})"
+
+
+def rebuild_statements(dialect):
+    """INSERT ... SELECT statements that add one chunk of rentals per dimension and event"""
+    # Same rules as return_event()
+    returned = later_of(dialect, "rentals.actual_return_date", "rentals.checkout_date")
+    late = f"{returned} > rentals.expected_return_date"
+    events = [
+        ("rentals.checkout_date", "rentals.checkout_date IS NOT NULL", {
+            "checkouts": "count(*)",
+            "lead_count": "count(requests.request_date)",
+            "lead_days": f"coalesce(sum({day_difference(dialect, 'rentals.checkout_date', 'requests.request_date')}), 0)",
+        }),
+        (returned, "rentals.checkout_date IS NOT NULL AND rentals.actual_return_date IS NOT NULL", {
+            "returns": "count(*)",
+            "rental_days": f"sum({day_difference(dialect, returned, 'rentals.checkout_date')})",
+            "late_returns": f"sum(CASE WHEN {late} THEN 1 ELSE 0 END)",
+            "late_days": (
+                f"sum(CASE WHEN {late} THEN "
+                f"{day_difference(dialect, returned, 'rentals.expected_return_date')} ELSE 0 END)"
+            ),
+        }),
+    ]
+    statements = []
+    for dimension, column in zip(DIMENSIONS, RENTAL_COLUMNS):
+        # Same fallback as rental_values()
+        value = f"coalesce(rentals.{column}, items.{dimension}, '')"
+        for day, condition, counters in events:
+            statements.append(f"""
+                INSERT INTO rental_stats_daily (dimension, day, value, {", ".join(counters)})
+                SELECT '{dimension}', {day}, {value}, {", ".join(counters.values())}
+                FROM rentals
+                JOIN items ON items.item_id = rentals.item_id
+                LEFT JOIN requests ON requests.request_id = rentals.request_id
+                WHERE rentals.rental_id BETWEEN :low AND :high AND {condition}
+                GROUP BY {day}, {value}
+                ON CONFLICT (dimension, day, value) DO UPDATE SET
+                    {", ".join(f"{name} = rental_stats_daily.{name} + excluded.{name}" for name in counters)}
+            """)
+    return statements
+
+
+# Run after rebuild_statements() have filled rental_stats_daily
+REBUILD_OPEN = """
+    INSERT INTO rental_stats_open (dimension, value, outstanding)
+    SELECT dimension, value, sum(checkouts - returns) FROM rental_stats_daily GROUP BY dimension, value
+"""
+
+
+# ---------- Reports ----------
+
+def week_of(day):
+    """The Monday starting `day`'s week"""
+    return day - timedelta(days=day.weekday())
+
+
+async def load_days(session, dimension, start, end):
+    """Rollup rows for `dimension` between start and end, inclusive"""
+    query = (
+        select(RentalStatsDaily)
+        .where(
+            RentalStatsDaily.dimension == dimension,
+            RentalStatsDaily.day.between(start, end),
+        )
+        .order_by(RentalStatsDaily.day)
+    )
+    return (await session.scalars(query)).all()
+
+
+async def out_before(session, dimension, start):
+    """Rentals per value still out at the start of `start`"""
+    # The running total less everything recorded from `start` on (future
+    # checkout dates included): a range scan of the days since `start`
+    totals = {value: out for value, out in await session.execute(
+        select(RentalStatsOpen.value, RentalStatsOpen.outstanding).where(RentalStatsOpen.dimension == dimension)
+    )}
+    since = await session.execute(
+        select(RentalStatsDaily.value, func.sum(RentalStatsDaily.checkouts - RentalStatsDaily.returns))
+        .where(RentalStatsDaily.dimension == dimension, RentalStatsDaily.day >= start)
+        .group_by(RentalStatsDaily.value)
+    )
+    for value, change in since:
+        totals[value] = totals.get(value, 0) - change
+    return totals
+
+
+def weekly_utilization(rows, opening, items, start, end):
+    """Per (week, value): checkouts, returns, item-days out and the share of item-days available
+
+    `opening` is the rentals out per value when `start` begins and `items`
+    the number of items per value; a rental is out from its checkout day
+    up to, not including, its return day.
+    """
+    changes = {}
+    for row in rows:
+        changes[row.day, row.value] = row
+    # Values with items but no rentals yet show up too, at 0%
+    values = sorted(set(opening) | {value for _, value in changes} | {value for value, count in items.items() if count})
+    out = dict(opening)
+    weeks = {}
+    day = start
+    while day <= end:
+        week = week_of(day)
+        for value in values:
+            stats = weeks.setdefault((week, value), {"checkouts": 0, "returns": 0, "item_days": 0, "days": 0})
+            row = changes.get((day, value))
+            if row is not None:
+                out[value] = out.get(value, 0) + row.checkouts - row.returns
+                stats["checkouts"] += row.checkouts
+                stats["returns"] += row.returns
+            stats["item_days"] += out.get(value, 0)
+            stats["days"] += 1
+        day += timedelta(days=1)
+
+    result = []
+    for (week, value), stats in sorted(weeks.items()):
+        count = items.get(value, 0)
+        capacity = count * stats.pop("days")
+        result.append({
+            "week": week,
+            "value": value,
+            "items": count,
+            **stats,
+            "utilization": round(stats["item_days"] / capacity, 4) if capacity else None,
+        })
+    return result
+
+
+def weekly_sums(rows, counters):
+    """Sum `counters` per (week, value)"""
+    weeks = {}
+    for row in rows:
+        totals = weeks.setdefault((week_of(row.day), row.value), dict.fromkeys(counters, 0))
+        for name in counters:
+            totals[name] += getattr(row, name)
+    return sorted(weeks.items())
+
+
+def average(total, count):
+    return round(total / count, 2) if count else None
+
+
+def lead_times(rows):
+    """Per (week, value): checkouts, how many came from a request, and the mean days from request to checkout"""
+    return [
+        {
+            "week": week,
+            "value": value,
+            "checkouts": totals["checkouts"],
+            "from_requests": totals["lead_count"],
+            "avg_lead_days": average(totals["lead_days"], totals["lead_count"]),
+        }
+        for (week, value), totals in weekly_sums(rows, ("checkouts", "lead_count", "lead_days"))
+        if totals["checkouts"]
+    ]
+
+
+def return_lateness(rows):
+    """Per (week, value): returns, mean rental length, and how many came back late and by how much"""
+    return [
+        {
+            "week": week,
+            "value": value,
+            "returns": totals["returns"],
+            "avg_rental_days": average(totals["rental_days"], totals["returns"]),
+            "late_returns": totals["late_returns"],
+            "late_rate": round(totals["late_returns"] / totals["returns"], 4),
+            "avg_days_late": average(totals["late_days"], totals["late_returns"]),
+        }
+        for (week, value), totals in weekly_sums(rows, ("returns", "rental_days", "late_returns", "late_days"))
+        if totals["returns"]
+    ]
+
+
+async def item_utilization(session, item_id, start, end, today):
+    """Weekly checkouts, returns and days out for one item, from its own rentals"""
+    rentals = (await session.execute(
+        select(Rental.checkout_date, Rental.actual_return_date)
+        .where(
+            Rental.item_id == item_id,
+            Rental.checkout_date <= end,
+            Rental.actual_return_date.is_(None) | (Rental.actual_return_date > start),
+        )
+    )).all()
+    weeks = {}
+    day = start
+    while day <= end:
+        weeks.setdefault(week_of(day), {"checkouts": 0, "returns": 0, "item_days": 0, "days": 0})["days"] += 1
+        day += timedelta(days=1)
+    for checkout, returned in rentals:
+        if returned is not None:
+            returned = max(returned, checkout)
+        if start <= checkout:
+            weeks[week_of(checkout)]["checkouts"] += 1
+        if returned is not None and returned <= end:
+            weeks[week_of(returned)]["returns"] += 1
+        # Open rentals count as out until today
+        last = min(returned - timedelta(days=1) if returned else today, end)
+        day = max(checkout, start)
+        while day <= last:
+            weeks[week_of(day)]["item_days"] += 1
+            day += timedelta(days=1)
+    result = []
+    for week, stats in sorted(weeks.items()):
+        days = stats.pop("days")
+        result.append({"week": week, **stats, "utilization": round(stats["item_days"] / days, 4)})
+    return result
@@ -1,16 +1,65 @@
-from fastapi import FastAPI, HTTPException, Query
+from fastapi import Depends, FastAPI, HTTPException, Query, Response
+from fastapi import Request as HTTPRequest
+from fastapi.responses import FileResponse, ORJSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy import create_engine, or_
-from sqlalchemy.orm import sessionmaker
-from models import Base, Item, Member, Request, Rental, Log
-from datetime import date
+from sqlalchemy import String, case, cast, func, insert, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+import analytics
+from audit import audit
+from availability import availability
+from bulk import (
+    BATCH_SIZE, CSV_TYPE, NDJSON_TYPE, clean, encode_csv_rows, encode_ndjson_rows, iter_records,
+)
+from cache import TTLCache
+from catalog import CatalogSnapshot
+from changes import on_commit, on_commit_keys, touch, track_keys, version
+from database import (
+    AsyncSessionLocal, ReadSessionLocal, async_engine, engine, get_db, get_read_db, replica_engine, run_with_retry,
+)
+from events import StreamingGZipMiddleware, broker
+from images import (
+    IMAGE_TYPES, MAX_IMAGE_BYTES, MEDIA_TYPES, ImageTooLarge, InvalidImage, byte_range, image_path, read_range,
+    shutdown_pool, store_image,
+)
+from jobs import start_jobs, stop_jobs
+from metrics import MetricsMiddleware, instrument_engine, registry
+from migrate import check_schema
+from models import OPEN_RENTAL_STATUSES, Item, Member, Request, Rental, Log
+from recommendations import RECOMMENDATION_COUNT, recommender
+from schemas import (
+    AnalyticsDimension, BatchOutcome, ItemCreate, ItemOut, ItemStatus, ItemUpdate, ItemUtilizationOut,
+    LeadTimeOut, LogOut, MemberCreate, MemberOut, Overview, RentalBatch, RentalCreate, RentalOut,
+    RequestBatch, RequestCreate, RequestOut, RequestUpdate, ReturnLatenessOut, UtilizationOut,
+)
+from search import match_expression, ranked_matches
+import asyncio
+import os
+import uuid
+from contextlib import asynccontextmanager
+from datetime import date, datetime, timedelta
+from typing import List
+
 
-app = FastAPI(title="Cornell Wardrobe API")
+@asynccontextmanager
+async def lifespan(app):
+    async with AsyncSessionLocal() as session:
+        await availability.rebuild(session)
+        if CATALOG_SNAPSHOT:
+            await catalog.ensure_fresh(session)
+    jobs = start_jobs()
+    audit.start()
+    yield
+    await stop_jobs(jobs)
+    await audit.stop()
+    shutdown_pool()
+    await async_engine.dispose()
+    await replica_engine.dispose()
 
-# Database setup
-engine = create_engine("sqlite:///wardrobe.db", echo=False)
-SessionLocal = sessionmaker(bind=engine)
-Base.metadata.create_all(engine)
+
+app = FastAPI(title="Cornell Wardrobe API", lifespan=lifespan, default_response_class=ORJSONResponse)
+
+# Schema changes are applied by migrate.py; only check they have been
+check_schema(engine)
 
 # CORS middleware
 app.add_middleware(
@@ -19,25 +68,239 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "Server-Timing"],
+)
+
+# Compress larger responses (catalog pages, exports) for clients that accept gzip
+app.add_middleware(
+    StreamingGZipMiddleware,
+    minimum_size=int(os.getenv("GZIP_MIN_SIZE", "1000")),
+    # The event stream must flush every chunk, and images are already compressed
+    exclude=("/events", "/images/"),
 )
 
-# Helper: create a session
-def get_session():
-    return SessionLocal()
+# Per-route latency and SQL statistics, served at /admin/metrics
+app.add_middleware(MetricsMiddleware)
+instrument_engine(async_engine.sync_engine)
+if replica_engine is not async_engine:
+    instrument_engine(replica_engine.sync_engine)
+
+# Helpers: keyset pagination and field projection for list routes
+MAX_PAGE_SIZE = 500
+
+
+def paginate(query, key, after, limit):
+    """Order by the key column and fetch one row past the page to detect more"""
+    if after is not None:
+        query = query.filter(key > after)
+    query = query.order_by(key)
+    if limit:
+        query = query.limit(limit + 1)
+    return query
+
+
+def next_page(rows, limit, response, cursor):
+    """Trim the look-ahead row and expose the cursor for the next page"""
+    if limit and len(rows) > limit:
+        rows = rows[:limit]
+        response.headers["X-Next-Cursor"] = str(cursor(rows[-1]))
+    return rows
+
+
+# Helpers: conditional GET for catalog reads
+CATALOG_MAX_AGE = int(os.getenv("CATALOG_MAX_AGE", "0"))
+
+# Table versions restart at zero with the process; the boot token keeps an
+# ETag handed out before a restart from matching afterwards. Tagged routes
+# (and those behind commit-invalidated caches) read from the primary: a
+# lagging replica could pair a current tag with an older body.
+ETAG_EPOCH = uuid.uuid4().hex[:8]
+
+
+def not_modified(request, response, tables):
+    """Tag the response with the tables' versions; a 304 if the client's copy is current"""
+    # Taken before the query runs, so a write racing the read can only make
+    # the tag older than the body, never newer
+    tag = '"' + "-".join([ETAG_EPOCH, *map(str, version(*tables))]) + '"'
+    # Weak: the gzip middleware serves compressed and identity bodies under
+    # this one tag, and a strong tag would promise they are byte-identical
+    headers = {"ETag": f"W/{tag}", "Cache-Control": f"public, max-age={CATALOG_MAX_AGE}, must-revalidate"}
+    response.headers.update(headers)
+    # If-None-Match uses weak comparison: W/ prefixes are ignored on both sides
+    candidates = request.headers.get("if-none-match", "")
+    if any(candidate.strip().removeprefix("W/") in (tag, "*") for candidate in candidates.split(",")):
+        return Response(status_code=304, headers=headers)
+    return None
+
+
+def parse_fields(fields, allowed):
+    """Parse a comma-separated fields= parameter against the allowed names"""
+    if not fields:
+        return None
+    selected = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in selected if f not in allowed]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    return selected
+
+
+def project(row, fields):
+    """Keep only the requested keys of a response row"""
+    if not fields:
+        return row
+    return {f: row[f] for f in fields}
+
+
+def json_rows(rows, response=None):
+    """Serialize a list payload with orjson, keeping headers set on `response`"""
+    # The rows are built from typed columns, so running them back through the
+    # response model (and jsonable_encoder) would cost far more than encoding
+    return ORJSONResponse(rows, headers=dict(response.headers) if response else None)
+
+
+def booking_conflict(item_id, start, end, ignore=()):
+    """409 if [start, end] overlaps an approved request or open rental"""
+    conflicts = availability.conflicts(item_id, start, end or start, ignore)
+    if conflicts:
+        booked = ", ".join(f"{source} {id}" for source, id in conflicts)
+        raise HTTPException(
+            status_code=409,
+            detail=f"Item {item_id} is already booked for these dates ({booked})",
+        )
+
+
+# Helpers: batched bulk imports
+MAX_REPORTED_ERRORS = 100
+
+
+class ImportReport:
+    """Running totals for a bulk import; only the first errors are kept"""
+
+    def __init__(self):
+        self.inserted = 0
+        self.error_count = 0
+        self.errors = []
+
+    def error(self, line, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line, "error": message})
+
+    def as_dict(self, noun):
+        return {
+            "message": f"✅ {self.inserted} {noun} added!",
+            "inserted": self.inserted,
+            "error_count": self.error_count,
+            "errors": self.errors,
+        }
+
+
+async def insert_batch(session, model, rows, report):
+    """Insert one batch with a single executemany and commit it"""
+    if rows:
+        await session.execute(insert(model), rows)
+        await session.commit()
+        report.inserted += len(rows)
 
 # ---------- ITEM ROUTES ----------
 
-@app.get("/items")
-def get_all_items(
+# Expected return date of the item's current checkout, resolved in the
+# main query through the rentals(item_id, status) index
+current_rental_end = (
+    select(Rental.expected_return_date)
+    .where(Rental.item_id == Item.item_id, Rental.status.in_(OPEN_RENTAL_STATUSES))
+    .order_by(Rental.rental_id)
+    .limit(1)
+    .correlate(Item)
+    .scalar_subquery()
+)
+
+# Response fields and the column expressions that produce them
+ITEM_COLUMNS = {
+    "id": Item.item_id,
+    "name": Item.name,
+    "category": Item.category,
+    "size": Item.size,
+    "color": Item.color,
+    "brand": Item.brand,
+    "status": Item.status,
+    "image_url": Item.image_url,
+    "rental_end_date": current_rental_end,
+}
+ITEM_FIELDS = list(ITEM_COLUMNS)
+
+# Tables an item response is built from, for its ETag
+CATALOG_TABLES = ("items", "rentals")
+
+
+def select_items(fields=None):
+    """Select item rows as plain columns, keyed by item_id first"""
+    fields = fields or ITEM_FIELDS
+    return select(Item.item_id, *[ITEM_COLUMNS[f] for f in fields])
+
+
+def item_to_dict(row, fields=None):
+    """Build an item response from a select_items() row"""
+    fields = fields or ITEM_FIELDS
+    return dict(zip(fields, row[1:]))
+
+
+# The /items filters: exact matches on size and status, case-insensitive
+# substring (ILIKE '%value%') on the rest
+ITEM_FILTERS = (("category", False), ("size", True), ("color", False), ("brand", False), ("status", True))
+
+
+def item_filters(**values):
+    """Map each filter given a value to (value, exact)"""
+    return {name: (values[name], exact) for name, exact in ITEM_FILTERS if values.get(name)}
+
+
+# Optional in-memory copy of the catalog for /items reads; commits mark the
+# items they touched and the next read reloads only those rows
+CATALOG_SNAPSHOT = os.getenv("CATALOG_SNAPSHOT", "false").lower() == "true"
+catalog = CatalogSnapshot(select_items, ITEM_FIELDS)
+
+if CATALOG_SNAPSHOT:
+    track_keys("items", "item_id")
+    track_keys("rentals", "item_id")
+
+    @on_commit_keys
+    def refresh_catalog(keys, inserted, unknown):
+        catalog.mark_changed(
+            keys.get("items", set()) | keys.get("rentals", set()),
+            inserted="items" in inserted,
+            unknown=bool(unknown & {"items", "rentals"}),
+        )
+
+
+@app.get("/items", response_model=List[ItemOut])
+async def get_all_items(
     category: str = None,
     size: str = None,
     color: str = None,
     brand: str = None,
-    status: str = None
+    status: ItemStatus = None,
+    after: int = None,
+    limit: int = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    fields: str = None,
+    request: HTTPRequest = None,
+    response: Response = None,
+    session: AsyncSession = Depends(get_db),
 ):
     """Get all items in inventory with optional filters"""
-    session = get_session()
-    query = session.query(Item)
+    fields = parse_fields(fields, ITEM_FIELDS)
+    cached = not_modified(request, response, CATALOG_TABLES)
+    if cached:
+        return cached
+
+    if CATALOG_SNAPSHOT:
+        await catalog.ensure_fresh(session)
+        filters = item_filters(category=category, size=size, color=color, brand=brand, status=status)
+        items = catalog.query(filters, after, limit + 1 if limit else None)
+        items = next_page(items, limit, response, lambda item: item.id)
+        return json_rows([catalog.as_dict(item, fields) for item in items], response)
+
+    query = select_items(fields)
     
     # Apply filters
     if category:
@@ -50,198 +313,460 @@ def get_all_items(
         query = query.filter(Item.brand.ilike(f"%{brand}%"))
     if status:
         query = query.filter(Item.status == status)
-    
-    items = query.all()
 
-    result = []
-    for item in items:
-        current_rental = next(
-            (r for r in item.rentals if r.status == "checked_out"), None
-        )
+    query = paginate(query, Item.item_id, after, limit)
+    rows = next_page((await session.execute(query)).all(), limit, response, lambda row: row[0])
 
-        result.append(
-            {
-                "id": item.item_id,
-                "name": item.name,
-                "category": item.category,
-                "size": item.size,
-                "color": item.color,
-                "brand": item.brand,
-                "status": item.status,
-                "image_url": item.image_url,
-                "rental_end_date": str(current_rental.expected_return_date)
-                if current_rental and current_rental.expected_return_date
-                else None,
-            }
-        )
+    return json_rows([item_to_dict(row, fields) for row in rows], response)
+
+
+@app.get("/items/search", response_model=List[ItemOut])
+async def search_items(
+    q: str = Query(..., min_length=1),
+    status: ItemStatus = None,
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+    fields: str = None,
+    session: AsyncSession = Depends(get_read_db),
+):
+    """Full-text search over item name, brand, color and category, best match first"""
+    fields = parse_fields(fields, ITEM_FIELDS)
+    if not match_expression(q):
+        return json_rows([])
+
+    matches = ranked_matches(q, engine.dialect.name)
+    query = select_items(fields).join(matches, matches.c.item_id == Item.item_id)
+    if status:
+        query = query.filter(Item.status == status)
+    rows = (await session.execute(query.order_by(matches.c.rank).limit(limit))).all()
+    return json_rows([item_to_dict(row, fields) for row in rows])
+
+
+# Booked items are dropped after the query, so /items/available reads
+# ahead in batches of at least this many rows until the page is full
+AVAILABLE_READ_AHEAD = 200
+
+
+@app.get("/items/available", response_model=List[ItemOut])
+async def get_available_items(
+    start: date,
+    end: date,
+    size: str = None,
+    category: str = None,
+    after: int = None,
+    limit: int = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    fields: str = None,
+    response: Response = None,
+    session: AsyncSession = Depends(get_read_db),
+):
+    """Items that are in circulation and have no booking overlapping [start, end]"""
+    if end < start:
+        raise HTTPException(status_code=400, detail="end must not be before start")
+    fields = parse_fields(fields, ITEM_FIELDS)
+    await availability.ensure_loaded(session)
+
+    query = select_items(fields).filter(Item.status.not_in(["repair", "retired"]))
+    if size:
+        query = query.filter(Item.size == size)
+    if category:
+        query = query.filter(Item.category.ilike(f"%{category}%"))
+    query = query.order_by(Item.item_id)
+
+    wanted = limit + 1 if limit else None
+    batch = max(wanted or 0, AVAILABLE_READ_AHEAD)
+    rows = []
+    while True:
+        page = query.filter(Item.item_id > after) if after is not None else query
+        fetched = (await session.execute(page.limit(batch) if wanted else page)).all()
+        rows.extend(row for row in fetched if availability.is_free(row[0], start, end))
+        if not wanted or len(rows) >= wanted or len(fetched) < batch:
+            break
+        after = fetched[-1][0]
+    rows = next_page(rows[:wanted] if wanted else rows, limit, response, lambda row: row[0])
+    return json_rows([item_to_dict(row, fields) for row in rows], response)
+
+
+@app.get("/items/export")
+async def export_items(fmt: str = Query("csv", alias="format", pattern="^(csv|ndjson)$")):
+    """Stream the whole inventory as CSV or NDJSON without building it in memory"""
+
+    async def generate():
+        if fmt == "csv":
+            yield encode_csv_rows(ITEM_FIELDS, [], header=True)
+        # The response outlives the request's dependencies, so the stream
+        # owns its session; rows come off a server-side cursor in batches
+        async with ReadSessionLocal() as session:
+            result = await session.stream(
+                select_items().order_by(Item.item_id).execution_options(yield_per=BATCH_SIZE)
+            )
+            async for rows in result.partitions():
+                rows = [row[1:] for row in rows]
+                if fmt == "csv":
+                    yield encode_csv_rows(ITEM_FIELDS, rows)
+                else:
+                    yield encode_ndjson_rows(ITEM_FIELDS, rows)
+
+    return StreamingResponse(
+        generate(),
+        media_type=CSV_TYPE if fmt == "csv" else NDJSON_TYPE,
+        headers={"Content-Disposition": f"attachment; filename=items.{fmt}"},
+    )
+
+
+# Item counts per (category, size, color, brand, status) combination, which
+# every facet request is answered from until items change
+facet_cache = TTLCache(ttl=int(os.getenv("FACET_CACHE_TTL", "300")))
+FACETS = [name for name, _ in ITEM_FILTERS]
+
+
+@on_commit
+def invalidate_facets(tables):
+    if "items" in tables:
+        facet_cache.clear()
 
-    session.close()
-    return result
 
+def count_facets(groups, filters):
+    """Per-facet value counts under `filters`, each facet ignoring its own filter"""
+    # Resolve each filter to the distinct values it accepts, so rows are
+    # checked with set lookups
+    accepted = {}
+    for position, name in enumerate(FACETS):
+        if name in filters:
+            value, exact = filters[name]
+            distinct = {row[position] for row in groups}
+            accepted[position] = (
+                {value} if exact else {v for v in distinct if v is not None and value.lower() in v.lower()}
+            )
 
-@app.get("/items/{item_id}")
-def get_item(item_id: int):
+    counts = [{} for _ in FACETS]
+    total = 0
+    for row in groups:
+        count = row[-1]
+        failed = [position for position, values in accepted.items() if row[position] not in values]
+        if not failed:
+            total += count
+            for position, value in enumerate(row[:-1]):
+                counts[position][value] = counts[position].get(value, 0) + count
+        elif len(failed) == 1:
+            # Excluded by only this facet's own filter: still counts as an option for it
+            position = failed[0]
+            counts[position][row[position]] = counts[position].get(row[position], 0) + count
+
+    return {
+        "total": total,
+        "facets": {
+            name: [
+                {"value": value, "count": count}
+                for value, count in sorted(counts[position].items(), key=lambda vc: (-vc[1], str(vc[0])))
+            ]
+            for position, name in enumerate(FACETS)
+        },
+    }
+
+
+async def facet_groups(session):
+    """(category, size, color, brand, status, count) for every combination, cached until items change"""
+    groups = facet_cache.get("groups")
+    if groups is None:
+        # One grouped pass over items; the facets are all derived from it
+        columns = [getattr(Item, name) for name in FACETS]
+        groups = (await session.execute(select(*columns, func.count()).group_by(*columns))).all()
+        facet_cache.set("groups", groups)
+    return groups
+
+
+@app.get("/items/facets")
+async def get_item_facets(
+    category: str = None,
+    size: str = None,
+    color: str = None,
+    brand: str = None,
+    status: ItemStatus = None,
+    request: HTTPRequest = None,
+    response: Response = None,
+    session: AsyncSession = Depends(get_db),
+):
+    """Counts per category, size, color, brand and status for the given filters"""
+    cached = not_modified(request, response, ("items",))
+    if cached:
+        return cached
+    groups = await facet_groups(session)
+    filters = item_filters(category=category, size=size, color=color, brand=brand, status=status)
+    return count_facets(groups, filters)
+
+
+@app.get("/items/{item_id}", response_model=ItemOut)
+async def get_item(
+    item_id: int,
+    request: HTTPRequest = None,
+    response: Response = None,
+    session: AsyncSession = Depends(get_db),
+):
     """Get a single item by ID"""
-    session = get_session()
-    item = session.query(Item).get(item_id)
+    cached = not_modified(request, response, CATALOG_TABLES)
+    if cached:
+        return cached
+    if CATALOG_SNAPSHOT:
+        await catalog.ensure_fresh(session)
+        item = catalog.items.get(item_id)
+        if item is None:
+            raise HTTPException(status_code=404, detail="Item not found")
+        return catalog.as_dict(item)
+
+    row = (await session.execute(select_items().filter(Item.item_id == item_id))).first()
     
-    if not item:
-        session.close()
+    if not row:
         raise HTTPException(status_code=404, detail="Item not found")
     
-    current_rental = next(
-        (r for r in item.rentals if r.status == "checked_out"), None
-    )
-    
-    session.close()
-    
-    return {
-        "id": item.item_id,
-        "name": item.name,
-        "category": item.category,
-        "size": item.size,
-        "color": item.color,
-        "brand": item.brand,
-        "status": item.status,
-        "image_url": item.image_url,
-        "rental_end_date": str(current_rental.expected_return_date)
-        if current_rental and current_rental.expected_return_date
-        else None,
-    }
+    return item_to_dict(row)
 
 
 @app.post("/items")
-def add_item(item: dict):
+async def add_item(item: ItemCreate, session: AsyncSession = Depends(get_db)):
     """Add a new item to the inventory"""
-    session = get_session()
-    new_item = Item(
-        name=item["name"],
-        category=item.get("category"),
-        size=item.get("size"),
-        color=item.get("color"),
-        brand=item.get("brand"),
-        status=item.get("status", "available"),
-        image_url=item.get("image_url"),
-    )
+    new_item = Item(**item.model_dump())
     session.add(new_item)
-    session.commit()
-    session.refresh(new_item)
-    session.close()
+    await session.commit()
+    await session.refresh(new_item)
+    audit.record("added", item_id=new_item.item_id)
+    broker.publish("item", {"id": new_item.item_id, "status": new_item.status})
     return {"message": "✅ Item added!", "item_id": new_item.item_id}
 
 
+ITEM_IMPORT_COLUMNS = ["name", "category", "size", "color", "brand", "status", "image_url"]
+ITEM_STATUSES = set(Item.status.type.enums)
+
+
+@app.post("/items/bulk")
+async def bulk_add_items(request: HTTPRequest, session: AsyncSession = Depends(get_db)):
+    """Import items from a streamed CSV or NDJSON body in batched inserts"""
+    report = ImportReport()
+    batch = []
+    async for line, row in iter_records(request):
+        if row is None:
+            report.error(line, "Malformed row")
+            continue
+        try:
+            values = clean(row, ITEM_IMPORT_COLUMNS)
+        except ValueError as exc:
+            report.error(line, str(exc))
+            continue
+        values["status"] = values["status"] or "available"
+        if not values["name"]:
+            report.error(line, "name is required")
+        elif values["status"] not in ITEM_STATUSES:
+            report.error(line, f"Invalid status: {values['status']}")
+        else:
+            batch.append(values)
+        if len(batch) >= BATCH_SIZE:
+            await insert_batch(session, Item, batch, report)
+            batch = []
+    await insert_batch(session, Item, batch, report)
+    if report.inserted:
+        # Too many to list; clients refetch the catalog
+        broker.publish("catalog", {"added": report.inserted}, key="catalog")
+    return report.as_dict("items")
+
+
 @app.patch("/items/{item_id}")
-def update_item(item_id: int, updates: dict):
+async def update_item(item_id: int, updates: ItemUpdate, session: AsyncSession = Depends(get_db)):
     """Update an item"""
-    session = get_session()
-    item = session.query(Item).get(item_id)
+    item = await session.get(Item, item_id)
     if not item:
         raise HTTPException(status_code=404, detail="Item not found")
     
-    # Update fields
-    for key, value in updates.items():
-        if hasattr(item, key):
-            setattr(item, key, value)
+    # Update only the fields the client sent
+    for key, value in updates.model_dump(exclude_unset=True).items():
+        setattr(item, key, value)
     
-    session.commit()
-    session.close()
+    await session.commit()
+    audit.record("updated", item_id=item_id)
+    broker.publish("item", {"id": item_id, "status": item.status})
     return {"message": f"Item {item_id} updated successfully"}
 
 
 @app.patch("/items/{item_id}/status")
-def update_item_status(item_id: int, status: str):
+async def update_item_status(item_id: int, status: ItemStatus, session: AsyncSession = Depends(get_db)):
     """Update an item's availability status"""
-    session = get_session()
-    item = session.query(Item).get(item_id)
+    item = await session.get(Item, item_id)
     if not item:
         raise HTTPException(status_code=404, detail="Item not found")
     item.status = status
-    session.commit()
-    session.close()
+    await session.commit()
+    audit.record(f"status: {status}", item_id=item_id)
+    broker.publish("item", {"id": item_id, "status": status})
     return {"message": f"Item {item_id} status updated to {status}"}
 
 
+# ---------- IMAGES ----------
+
+# Stored images never change under their name, so browsers can keep them for a year
+IMAGE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+@app.put("/items/{item_id}/image")
+async def upload_item_image(item_id: int, request: HTTPRequest, session: AsyncSession = Depends(get_db)):
+    """Store a photo sent as the raw request body and make it the item's image"""
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+    if content_type not in IMAGE_TYPES:
+        raise HTTPException(status_code=415, detail=f"Upload one of: {', '.join(IMAGE_TYPES)}")
+    item = await session.get(Item, item_id)
+    if not item:
+        raise HTTPException(status_code=404, detail="Item not found")
+
+    body = bytearray()
+    async for chunk in request.stream():
+        body += chunk
+        if len(body) > MAX_IMAGE_BYTES:
+            raise HTTPException(status_code=413, detail=f"Images are limited to {MAX_IMAGE_BYTES} bytes")
+    try:
+        name, variants = await store_image(bytes(body), content_type)
+    except ImageTooLarge:
+        raise HTTPException(status_code=413, detail="Image dimensions are too large")
+    except InvalidImage:
+        raise HTTPException(status_code=400, detail="Not a readable image")
+
+    # Stored relative: the host (and scheme) this request came in on may not
+    # be the one clients reach the API by, e.g. behind a proxy
+    item.image_url = app.url_path_for("get_image", name=name)
+    await session.commit()
+    audit.record("image updated", item_id=item_id)
+    return {
+        "message": "✅ Image uploaded!",
+        "image_url": item.image_url,
+        "thumbnails": {width: app.url_path_for("get_image", name=v) for width, v in variants.items()},
+    }
+
+
+@app.get("/images/{name}")
+async def get_image(name: str, request: HTTPRequest):
+    """Serve a stored image or thumbnail, with byte-range support"""
+    path = image_path(name)
+    if not path or not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Image not found")
+
+    headers = {"Cache-Control": IMAGE_CACHE_CONTROL, "ETag": f'"{name}"', "Accept-Ranges": "bytes"}
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
+
+    media_type = MEDIA_TYPES[name.rsplit(".", 1)[1]]
+    size = os.path.getsize(path)
+    try:
+        span = byte_range(request.headers.get("range"), size)
+    except ValueError:
+        return Response(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+    if span:
+        start, end = span
+        body = await asyncio.to_thread(read_range, path, start, end)
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        return Response(body, status_code=206, media_type=media_type, headers=headers)
+    return FileResponse(path, media_type=media_type, headers=headers)
+
+
 # ---------- REQUEST ROUTES ----------
 
 @app.post("/requests")
-def create_request(req: dict):
+async def create_request(req: RequestCreate, session: AsyncSession = Depends(get_db)):
     """Submit a new rental request"""
-    session = get_session()
-    
-    # Map frontend fields to database fields
-    # Frontend sends: borrower_id, item_id, start_date, end_date, purpose
-    start_date = req.get("start_date")
-    end_date = req.get("end_date")
+    start_date, end_date = req.start_date, req.end_date
+
+    # Reject dates that overlap an approved booking of the item
+    if start_date:
+        if end_date and end_date < start_date:
+            raise HTTPException(status_code=400, detail="end_date must not be before start_date")
+        await availability.ensure_loaded(session)
+        booking_conflict(req.item_id, start_date, end_date)
     
     new_request = Request(
-        member_id=req.get("borrower_id") or req.get("member_id"),
-        item_id=req["item_id"],
-        start_date=date.fromisoformat(start_date) if start_date else None,
-        end_date=date.fromisoformat(end_date) if end_date else None,
-        purpose=req.get("purpose"),
+        member_id=req.borrower_id or req.member_id,
+        item_id=req.item_id,
+        start_date=start_date,
+        end_date=end_date,
+        purpose=req.purpose,
         status="pending",
     )
     session.add(new_request)
-    session.commit()
-    session.refresh(new_request)
-    session.close()
+    await session.commit()
+    await session.refresh(new_request)
+    broker.publish("request", {"id": new_request.request_id, "item_id": new_request.item_id, "status": "pending"})
     return {"message": "✅ Request submitted!", "request_id": new_request.request_id}
 
 
-@app.get("/requests")
-def get_requests():
+REQUEST_FIELDS = [
+    "id", "item_id", "item_name", "item_brand", "borrower_id", "borrower_name",
+    "start_date", "end_date", "status", "purpose", "created_at",
+]
+
+
+@app.get("/requests", response_model=List[RequestOut])
+async def get_requests(
+    after: int = None,
+    limit: int = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    fields: str = None,
+    response: Response = None,
+    session: AsyncSession = Depends(get_read_db),
+):
     """View all requests with related data"""
-    session = get_session()
-    reqs = session.query(Request).all()
-    
+    fields = parse_fields(fields, REQUEST_FIELDS)
+
+    # Resolve item, member and rental status in one statement instead of
+    # three lookups per request row
+    rental_status = (
+        select(Rental.status)
+        .where(Rental.item_id == Request.item_id, Rental.member_id == Request.member_id)
+        .order_by(Rental.rental_id)
+        .limit(1)
+        .scalar_subquery()
+    )
+    status = case(
+        (rental_status.in_(OPEN_RENTAL_STATUSES), "active"),
+        (rental_status == "returned", "completed"),
+        # PostgreSQL won't mix its request_status enum with text labels
+        else_=cast(Request.status, String),
+    )
+
+    query = (
+        select(
+            Request,
+            Item.name.label("item_name"),
+            Item.brand.label("item_brand"),
+            Member.name.label("borrower_name"),
+            status.label("status"),
+        )
+        .outerjoin(Item, Item.item_id == Request.item_id)
+        .outerjoin(Member, Member.member_id == Request.member_id)
+    )
+    query = paginate(query, Request.request_id, after, limit)
+    rows = next_page((await session.execute(query)).all(), limit, response, lambda row: row[0].request_id)
+
     result = []
-    for r in reqs:
-        # Get related item and member info
-        item = session.query(Item).get(r.item_id)
-        member = session.query(Member).get(r.member_id)
-        
-        # Get associated rental if this request is approved/active
-        rental = session.query(Rental).filter(
-            Rental.item_id == r.item_id,
-            Rental.member_id == r.member_id
-        ).first()
-        
-        status = r.status
-        if rental:
-            if rental.status == "checked_out":
-                status = "active"
-            elif rental.status == "returned":
-                status = "completed"
-        
-        result.append({
+    for r, item_name, item_brand, borrower_name, status in rows:
+        result.append(project({
             "id": r.request_id,
             "item_id": r.item_id,
-            "item_name": item.name if item else None,
-            "item_brand": item.brand if item else None,
+            "item_name": item_name,
+            "item_brand": item_brand,
             "borrower_id": r.member_id,
-            "borrower_name": member.name if member else None,
-            "start_date": str(r.start_date) if r.start_date else str(r.request_date),
-            "end_date": str(r.end_date) if r.end_date else str(r.request_date),
+            "borrower_name": borrower_name,
+            "start_date": r.start_date or r.request_date,
+            "end_date": r.end_date or r.request_date,
             "status": status,
             "purpose": r.purpose,
-            "created_at": str(r.request_date),
-        })
-    
-    session.close()
-    return result
+            "created_at": r.request_date,
+        }, fields))
 
+    return json_rows(result, response)
 
-@app.get("/requests/{request_id}")
-def get_request(request_id: int):
+
+@app.get("/requests/{request_id}", response_model=RequestOut)
+async def get_request(request_id: int, session: AsyncSession = Depends(get_read_db)):
     """Get a single request by ID"""
-    session = get_session()
-    req = session.query(Request).get(request_id)
+    req = await session.get(Request, request_id)
     if not req:
         raise HTTPException(status_code=404, detail="Request not found")
     
     # Get related data
-    item = session.query(Item).get(req.item_id)
-    member = session.query(Member).get(req.member_id)
+    item = await session.get(Item, req.item_id)
+    member = await session.get(Member, req.member_id)
     
     result = {
         "id": req.request_id,
@@ -250,199 +775,781 @@ def get_request(request_id: int):
         "item_brand": item.brand if item else None,
         "borrower_id": req.member_id,
         "borrower_name": member.name if member else None,
-        "start_date": str(req.start_date) if req.start_date else None,
-        "end_date": str(req.end_date) if req.end_date else None,
+        "start_date": req.start_date,
+        "end_date": req.end_date,
         "purpose": req.purpose,
         "status": req.status,
-        "created_at": str(req.request_date),
+        "created_at": req.request_date,
     }
     
-    session.close()
     return result
 
 
+async def claim_item(session, item_id):
+    """Atomically flip an available item to rented; 409/404 if it cannot be claimed"""
+    # A conditional UPDATE takes the row (or, on SQLite, the database) write
+    # lock and re-checks the status in one step, so only one concurrent
+    # checkout or approval can see rowcount == 1
+    result = await session.execute(
+        update(Item)
+        .where(Item.item_id == item_id, Item.status == "available")
+        .values(status="rented")
+        .execution_options(synchronize_session=False)
+    )
+    touch(session, "items", item_id)
+    if result.rowcount == 0:
+        if await session.get(Item, item_id) is None:
+            raise HTTPException(status_code=404, detail="Item not found")
+        raise HTTPException(status_code=409, detail=f"Item {item_id} is not available")
+
+
+async def approve_request(session, req, updates):
+    """Approve a request and check its item out; returns the new Rental, if any"""
+    req.status = "approved"
+
+    # A booking that starts later only holds its dates in the calendar; the
+    # item is claimed when the request is approved again on or after its start
+    if req.start_date and req.start_date > date.today():
+        return None
+
+    # Check if rental already exists
+    existing_rental = (await session.scalars(select(Rental).filter(
+        Rental.item_id == req.item_id,
+        Rental.member_id == req.member_id,
+        Rental.status.in_(OPEN_RENTAL_STATUSES)
+    ))).first()
+    if existing_rental:
+        return None
+
+    await claim_item(session, req.item_id)
+
+    # Get dates from the request if available, otherwise from updates
+    checkout_date = req.start_date or updates.checkout_date or date.today()
+    return_date = req.end_date or updates.expected_return_date
+    values = (await analytics.item_values(session, [req.item_id]))[req.item_id]
+
+    new_rental = Rental(
+        item_id=req.item_id,
+        member_id=req.member_id,
+        checkout_date=checkout_date,
+        expected_return_date=return_date,
+        status="checked_out",
+        request_id=req.request_id,
+        **analytics.rental_columns(values),
+    )
+    session.add(new_rental)
+    await analytics.record(session, [analytics.checkout_event(values, checkout_date, req.request_date)])
+    return new_rental
+
+
 @app.patch("/requests/{request_id}")
-def update_request(request_id: int, updates: dict):
+async def update_request(request_id: int, updates: RequestUpdate, session: AsyncSession = Depends(get_db)):
     """Update a request (e.g., approve/reject)"""
-    session = get_session()
-    req = session.query(Request).get(request_id)
-    if not req:
-        raise HTTPException(status_code=404, detail="Request not found")
-    
-    status = updates.get("status")
-    if status:
-        req.status = status
-        
-        # If approving, create a rental record
+    status = updates.status
+
+    async def apply():
+        req = await session.get(Request, request_id)
+        if not req:
+            raise HTTPException(status_code=404, detail="Request not found")
+
+        new_rental = None
         if status == "approved":
-            # Check if rental already exists
-            existing_rental = session.query(Rental).filter(
-                Rental.item_id == req.item_id,
-                Rental.member_id == req.member_id,
-                Rental.status == "checked_out"
-            ).first()
-            
-            if not existing_rental:
-                # Get dates from the request if available, otherwise from updates
-                checkout_date = req.start_date or updates.get("checkout_date")
-                return_date = req.end_date or updates.get("expected_return_date")
-                
-                if isinstance(checkout_date, str):
-                    checkout_date = date.fromisoformat(checkout_date)
-                elif not checkout_date:
-                    checkout_date = date.today()
-                
-                if isinstance(return_date, str):
-                    return_date = date.fromisoformat(return_date)
-                
-                new_rental = Rental(
-                    item_id=req.item_id,
-                    member_id=req.member_id,
-                    checkout_date=checkout_date,
-                    expected_return_date=return_date,
-                    status="checked_out",
-                )
-                
-                # Update item status
-                item = session.query(Item).get(req.item_id)
-                if item:
-                    item.status = "rented"
-                
-                session.add(new_rental)
-    
-    session.commit()
-    session.close()
+            if req.start_date:
+                await availability.ensure_loaded(session)
+                # Neither the request's own booking nor a rental it already
+                # produced counts against approving it again
+                linked = await session.scalars(select(Rental.rental_id).where(
+                    Rental.request_id == req.request_id, Rental.status.in_(OPEN_RENTAL_STATUSES)
+                ))
+                ignore = [("request", req.request_id), *(("rental", rental_id) for rental_id in linked)]
+                booking_conflict(req.item_id, req.start_date, req.end_date, ignore=ignore)
+            new_rental = await approve_request(session, req, updates)
+        elif status:
+            req.status = status
+
+        await session.commit()
+        return req, new_rental
+
+    req, new_rental = await run_with_retry(session, apply)
+
+    # Keep the availability calendar in step with the committed state
+    if status == "approved" and req.start_date:
+        availability.add(req.item_id, ("request", req.request_id), req.start_date, req.end_date)
+    elif status:
+        availability.remove(("request", req.request_id))
+    if new_rental:
+        availability.add(new_rental.item_id, ("rental", new_rental.rental_id),
+                         new_rental.checkout_date, new_rental.expected_return_date)
+        audit.record("checked_out", item_id=new_rental.item_id, user_id=new_rental.member_id)
+        broker.publish("item", {"id": new_rental.item_id, "status": "rented"})
+    if status:
+        audit.record(f"request {status}", item_id=req.item_id, user_id=req.member_id)
+        broker.publish("request", {"id": req.request_id, "item_id": req.item_id, "status": req.status})
     return {"message": f"Request {request_id} updated successfully"}
 
 
+def unique(ids):
+    """Drop repeated ids, keeping the first occurrence's position"""
+    return list(dict.fromkeys(ids))
+
+
+@app.post("/requests/approve-batch", response_model=List[BatchOutcome])
+async def approve_requests(batch: RequestBatch, session: AsyncSession = Depends(get_db)):
+    """Approve many requests in one transaction; per-id outcomes instead of a 4xx"""
+    ids = unique(batch.request_ids)
+
+    async def apply():
+        outcomes = {}
+        requests = {req.request_id: req for req in await session.scalars(
+            select(Request).where(Request.request_id.in_(ids))
+        )}
+        item_ids = {req.item_id for req in requests.values()}
+        # Same rules as approve_request(): a member who already has the item
+        # out, or a request that starts later, gets the approval without a rental
+        checked_out, linked = set(), {}
+        for item_id, member_id, rental_id, linked_request in await session.execute(
+            select(Rental.item_id, Rental.member_id, Rental.rental_id, Rental.request_id)
+            .where(Rental.item_id.in_(item_ids), Rental.status.in_(OPEN_RENTAL_STATUSES))
+        ):
+            checked_out.add((item_id, member_id))
+            linked.setdefault(linked_request, []).append(("rental", rental_id))
+        await availability.ensure_loaded(session)
+
+        today = date.today()
+        approved, to_check_out = [], []
+        booked = {}  # item_id -> [(start, end)] approved earlier in this batch
+        for request_id in ids:
+            req = requests.get(request_id)
+            if req is None:
+                outcomes[request_id] = {"id": request_id, "outcome": "not_found", "detail": "Request not found"}
+                continue
+            if req.start_date:
+                end = req.end_date or req.start_date
+                ignore = [("request", request_id), *linked.get(request_id, ())]
+                clash = availability.conflicts(req.item_id, req.start_date, end, ignore=ignore)
+                if clash or any(s <= end and req.start_date <= e for s, e in booked.get(req.item_id, ())):
+                    outcomes[request_id] = {
+                        "id": request_id, "outcome": "conflict",
+                        "detail": f"Item {req.item_id} is already booked for these dates",
+                    }
+                    continue
+                booked.setdefault(req.item_id, []).append((req.start_date, end))
+            if (req.item_id, req.member_id) in checked_out or (req.start_date and req.start_date > today):
+                approved.append(req)
+            else:
+                to_check_out.append(req)
+
+        # One conditional UPDATE claims every item that is still available;
+        # the first request in the batch for an item gets it
+        claimed = set()
+        wanted = unique(req.item_id for req in to_check_out)
+        if wanted:
+            claimed = set(await session.scalars(
+                update(Item)
+                .where(Item.item_id.in_(wanted), Item.status == "available")
+                .values(status="rented")
+                .returning(Item.item_id)
+                .execution_options(synchronize_session=False)
+            ))
+            touch(session, "items", *claimed)
+        rentals = []
+        for req in to_check_out:
+            if req.item_id in claimed:
+                claimed.discard(req.item_id)
+                approved.append(req)
+                rentals.append(req)
+            else:
+                outcomes[req.request_id] = {
+                    "id": req.request_id, "outcome": "conflict", "detail": f"Item {req.item_id} is not available",
+                }
+
+        if approved:
+            await session.execute(
+                update(Request)
+                .where(Request.request_id.in_([req.request_id for req in approved]))
+                .values(status="approved")
+                .execution_options(synchronize_session=False)
+            )
+        rental_ids = {}
+        if rentals:
+            values = await analytics.item_values(session, [req.item_id for req in rentals])
+            new_ids = await session.scalars(
+                insert(Rental).returning(Rental.rental_id, sort_by_parameter_order=True),
+                [{
+                    "item_id": req.item_id,
+                    "member_id": req.member_id,
+                    "checkout_date": req.start_date or today,
+                    "expected_return_date": req.end_date,
+                    "status": "checked_out",
+                    "request_id": req.request_id,
+                    **analytics.rental_columns(values[req.item_id]),
+                } for req in rentals],
+            )
+            rental_ids = dict(zip((req.request_id for req in rentals), new_ids))
+            await analytics.record(session, [
+                analytics.checkout_event(values[req.item_id], req.start_date or today, req.request_date)
+                for req in rentals
+            ])
+
+        await session.commit()
+        return outcomes, approved, rental_ids
+
+    outcomes, approved, rental_ids = await run_with_retry(session, apply)
+
+    # Keep the availability calendar in step with the committed state
+    today = date.today()
+    for req in approved:
+        rental_id = rental_ids.get(req.request_id)
+        outcomes[req.request_id] = {"id": req.request_id, "outcome": "approved", "rental_id": rental_id}
+        if req.start_date:
+            availability.add(req.item_id, ("request", req.request_id), req.start_date, req.end_date)
+        if rental_id:
+            availability.add(req.item_id, ("rental", rental_id), req.start_date or today, req.end_date)
+            audit.record("checked_out", item_id=req.item_id, user_id=req.member_id)
+            broker.publish("item", {"id": req.item_id, "status": "rented"})
+        audit.record("request approved", item_id=req.item_id, user_id=req.member_id)
+        broker.publish("request", {"id": req.request_id, "item_id": req.item_id, "status": "approved"})
+    return json_rows([outcomes[request_id] for request_id in ids])
+
+
 # ---------- RENTAL ROUTES ----------
 
-@app.get("/rentals")
-def get_rentals():
+RENTAL_FIELDS = [
+    "id", "item_id", "item_name", "member_id", "member_name",
+    "checkout_date", "expected_return_date", "actual_return_date", "status",
+]
+
+
+def rental_to_dict(rental, item_name, member_name):
+    return {
+        "id": rental.rental_id,
+        "item_id": rental.item_id,
+        "item_name": item_name,
+        "member_id": rental.member_id,
+        "member_name": member_name,
+        "checkout_date": rental.checkout_date,
+        "expected_return_date": rental.expected_return_date,
+        "actual_return_date": rental.actual_return_date,
+        "status": rental.status,
+    }
+
+
+@app.get("/rentals", response_model=List[RentalOut])
+async def get_rentals(
+    after: int = None,
+    limit: int = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    fields: str = None,
+    response: Response = None,
+    session: AsyncSession = Depends(get_read_db),
+):
     """Get all rentals"""
-    session = get_session()
-    rentals = session.query(Rental).all()
-    
-    result = []
-    for rental in rentals:
-        item = session.query(Item).get(rental.item_id)
-        member = session.query(Member).get(rental.member_id)
-        
-        result.append({
-            "id": rental.rental_id,
-            "item_id": rental.item_id,
-            "item_name": item.name if item else None,
-            "member_id": rental.member_id,
-            "member_name": member.name if member else None,
-            "checkout_date": str(rental.checkout_date) if rental.checkout_date else None,
-            "expected_return_date": str(rental.expected_return_date) if rental.expected_return_date else None,
-            "actual_return_date": str(rental.actual_return_date) if rental.actual_return_date else None,
-            "status": rental.status,
-        })
-    
-    session.close()
-    return result
+    fields = parse_fields(fields, RENTAL_FIELDS)
+    query = (
+        select(Rental, Item.name, Member.name)
+        .outerjoin(Item, Item.item_id == Rental.item_id)
+        .outerjoin(Member, Member.member_id == Rental.member_id)
+    )
+    query = paginate(query, Rental.rental_id, after, limit)
+    rows = next_page((await session.execute(query)).all(), limit, response, lambda row: row[0].rental_id)
+    return json_rows([project(rental_to_dict(*row), fields) for row in rows], response)
+
+
+@app.get("/rentals/overdue", response_model=List[RentalOut])
+async def get_overdue_rentals(
+    limit: int = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    session: AsyncSession = Depends(get_read_db),
+):
+    """Rentals past their expected return date, most overdue first"""
+    # Both branches are range scans on ix_rentals_status_due, so only the
+    # due slice is read; the second catches rentals the sweeper hasn't marked yet
+    due = (Rental.status == "overdue") | (
+        (Rental.status == "checked_out") & (Rental.expected_return_date < date.today())
+    )
+    query = (
+        select(Rental, Item.name, Member.name)
+        .outerjoin(Item, Item.item_id == Rental.item_id)
+        .outerjoin(Member, Member.member_id == Rental.member_id)
+        .where(due)
+        .order_by(Rental.expected_return_date, Rental.rental_id)
+        .limit(limit)
+    )
+    rows = (await session.execute(query)).all()
+    return json_rows([rental_to_dict(*row) for row in rows])
 
 
 @app.post("/rentals")
-def checkout_item(data: dict):
+async def checkout_item(data: RentalCreate, session: AsyncSession = Depends(get_db)):
     """Mark an item as checked out and create rental record"""
-    session = get_session()
-    new_rental = Rental(
-        item_id=data["item_id"],
-        member_id=data["member_id"],
-        checkout_date=data.get("checkout_date"),
-        expected_return_date=data.get("expected_return_date"),
-        status="checked_out",
-    )
 
-    # Update item status to 'rented'
-    item = session.query(Item).get(data["item_id"])
-    if item:
-        item.status = "rented"
+    async def apply():
+        # Update item status to 'rented' only if it is still available
+        await claim_item(session, data.item_id)
+        values = (await analytics.item_values(session, [data.item_id]))[data.item_id]
 
-    session.add(new_rental)
-    session.commit()
-    session.refresh(new_rental)
-    session.close()
+        new_rental = Rental(
+            item_id=data.item_id,
+            member_id=data.member_id,
+            checkout_date=data.checkout_date or date.today(),
+            expected_return_date=data.expected_return_date,
+            status="checked_out",
+            **analytics.rental_columns(values),
+        )
+        session.add(new_rental)
+        await analytics.record(session, [analytics.checkout_event(values, new_rental.checkout_date)])
+        await session.commit()
+        return new_rental
+
+    new_rental = await run_with_retry(session, apply)
+    availability.add(new_rental.item_id, ("rental", new_rental.rental_id),
+                     new_rental.checkout_date, new_rental.expected_return_date)
+    audit.record("checked_out", item_id=new_rental.item_id, user_id=new_rental.member_id)
+    broker.publish("item", {"id": new_rental.item_id, "status": "rented"})
     return {"message": "✅ Item checked out!", "rental_id": new_rental.rental_id}
 
 
+# What the return routes read back from the rentals they close
+RETURNED_COLUMNS = (
+    Rental.rental_id, Rental.item_id, Rental.member_id, Rental.request_id,
+    Rental.checkout_date, Rental.expected_return_date,
+    Rental.item_category, Rental.item_size, Rental.item_brand,
+)
+
+
 @app.patch("/rentals/{rental_id}/return")
-def return_item(rental_id: int):
+async def return_item(rental_id: int, session: AsyncSession = Depends(get_db)):
     """Mark a rental as returned"""
-    session = get_session()
-    rental = session.query(Rental).get(rental_id)
-    if not rental:
-        raise HTTPException(status_code=404, detail="Rental not found")
-
-    rental.status = "returned"
-    rental.actual_return_date = date.today()
-    item = session.query(Item).get(rental.item_id)
-    if item:
-        item.status = "available"
-
-    session.commit()
-    session.close()
+
+    async def apply():
+        today = date.today()
+        # Conditional like claim_item(): only an open rental can be returned,
+        # so returning a closed one again can't free an item someone else has out
+        rental = (await session.execute(
+            update(Rental)
+            .where(Rental.rental_id == rental_id, Rental.status.in_(OPEN_RENTAL_STATUSES))
+            .values(status="returned", actual_return_date=today)
+            .returning(*RETURNED_COLUMNS)
+            .execution_options(synchronize_session=False)
+        )).one_or_none()
+        if rental is None:
+            if await session.get(Rental, rental_id) is None:
+                raise HTTPException(status_code=404, detail="Rental not found")
+            raise HTTPException(status_code=409, detail=f"Rental {rental_id} is not checked out")
+        values = await analytics.rental_values(session, [rental])
+        await analytics.record(session, [analytics.return_event(
+            values[rental.rental_id], rental.checkout_date, rental.expected_return_date, today
+        )])
+        if rental.item_id is not None:
+            await session.execute(
+                update(Item)
+                .where(Item.item_id == rental.item_id)
+                .values(status="available")
+                .execution_options(synchronize_session=False)
+            )
+            touch(session, "items", rental.item_id)
+            touch(session, "rentals", rental.item_id)
+        await session.commit()
+        return rental
+
+    rental = await run_with_retry(session, apply)
+    availability.release_rental(rental)
+    audit.record("returned", item_id=rental.item_id, user_id=rental.member_id)
+    broker.publish("rental", {"id": rental_id, "item_id": rental.item_id, "status": "returned"})
+    if rental.item_id is not None:
+        broker.publish("item", {"id": rental.item_id, "status": "available"})
     return {"message": f"✅ Rental {rental_id} marked as returned"}
 
 
+@app.post("/rentals/return-batch", response_model=List[BatchOutcome])
+async def return_rentals(batch: RentalBatch, session: AsyncSession = Depends(get_db)):
+    """Return many rentals in one transaction; per-id outcomes instead of a 4xx"""
+    ids = unique(batch.rental_ids)
+
+    async def apply():
+        today = date.today()
+        returned = (await session.execute(
+            update(Rental)
+            .where(Rental.rental_id.in_(ids), Rental.status.in_(OPEN_RENTAL_STATUSES))
+            .values(status="returned", actual_return_date=today)
+            .returning(*RETURNED_COLUMNS)
+            .execution_options(synchronize_session=False)
+        )).all()
+        values = await analytics.rental_values(session, returned)
+        await analytics.record(session, [
+            analytics.return_event(values[row.rental_id], row.checkout_date, row.expected_return_date, today)
+            for row in returned
+        ])
+        item_ids = unique(row.item_id for row in returned)
+        if item_ids:
+            await session.execute(
+                update(Item)
+                .where(Item.item_id.in_(item_ids))
+                .values(status="available")
+                .execution_options(synchronize_session=False)
+            )
+            touch(session, "items", *item_ids)
+            touch(session, "rentals", *item_ids)
+        # Tell ids that exist but were already closed apart from unknown ones
+        missing = set(ids) - {row.rental_id for row in returned}
+        closed = set()
+        if missing:
+            closed = set(await session.scalars(select(Rental.rental_id).where(Rental.rental_id.in_(missing))))
+        await session.commit()
+        return returned, closed
+
+    returned, closed = await run_with_retry(session, apply)
+
+    outcomes = {}
+    for rental in returned:
+        outcomes[rental.rental_id] = {"id": rental.rental_id, "outcome": "returned"}
+        availability.release_rental(rental)
+        audit.record("returned", item_id=rental.item_id, user_id=rental.member_id)
+        broker.publish("rental", {"id": rental.rental_id, "item_id": rental.item_id, "status": "returned"})
+        broker.publish("item", {"id": rental.item_id, "status": "available"})
+    for rental_id in ids:
+        if rental_id in closed:
+            outcomes[rental_id] = {"id": rental_id, "outcome": "conflict", "detail": f"Rental {rental_id} is not checked out"}
+        elif rental_id not in outcomes:
+            outcomes[rental_id] = {"id": rental_id, "outcome": "not_found", "detail": "Rental not found"}
+    return json_rows([outcomes[rental_id] for rental_id in ids])
+
+
+# ---------- LIVE EVENTS ----------
+
+@app.get("/events")
+async def stream_events():
+    """Live item, request and rental changes as Server-Sent Events"""
+    return StreamingResponse(
+        broker.stream(),
+        media_type="text/event-stream",
+        # Stop nginx-style proxies from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/admin/events")
+def get_event_stats():
+    """Connected event-stream clients and publish/coalesce/overflow counters"""
+    return broker.stats()
+
+
 # ---------- ADMIN DASHBOARD ----------
 
-@app.get("/admin/overview")
-def get_admin_summary():
+# Dashboard polls are served from memory until the TTL lapses or an item,
+# request or rental is written
+overview_cache = TTLCache(ttl=int(os.getenv("OVERVIEW_CACHE_TTL", "30")))
+
+
+@on_commit
+def invalidate_overview(tables):
+    if tables & {"items", "requests", "rentals"}:
+        overview_cache.clear()
+
+
+def select_overview():
+    """All dashboard counts in one statement: one pass over items plus two counts"""
+    item_counts = select(
+        func.count(Item.item_id).label("total"),
+        func.coalesce(func.sum(case((Item.status == "available", 1), else_=0)), 0).label("available"),
+        func.coalesce(func.sum(case((Item.status == "rented", 1), else_=0)), 0).label("rented"),
+    ).subquery()
+    return select(
+        item_counts.c.total,
+        item_counts.c.available,
+        item_counts.c.rented,
+        select(func.count(Request.request_id))
+        .where(Request.status == "pending")
+        .scalar_subquery(),
+        select(func.count(Rental.rental_id))
+        .where(Rental.status.in_(OPEN_RENTAL_STATUSES))
+        .scalar_subquery(),
+    )
+
+
+@app.get("/admin/overview", response_model=Overview)
+async def get_admin_summary(session: AsyncSession = Depends(get_db)):
     """Get counts of items, rentals, and requests"""
-    session = get_session()
-    
-    total_items = session.query(Item).count()
-    available_items = session.query(Item).filter(Item.status == "available").count()
-    rented_items = session.query(Item).filter(Item.status == "rented").count()
-    pending_requests = session.query(Request).filter(Request.status == "pending").count()
-    active_rentals = session.query(Rental).filter(Rental.status == "checked_out").count()
-    
-    session.close()
-    
-    return {
-        "total_items": total_items,
-        "available_items": available_items,
-        "rented_items": rented_items,
-        "pending_requests": pending_requests,
-        "active_rentals": active_rentals,
+    cached = overview_cache.get("overview")
+    if cached is not None:
+        return cached
+
+    row = (await session.execute(select_overview())).one()
+    result = {
+        "total_items": row[0],
+        "available_items": row[1],
+        "rented_items": row[2],
+        "pending_requests": row[3],
+        "active_rentals": row[4],
     }
+    overview_cache.set("overview", result)
+    return result
+
+
+@app.get("/admin/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """Per-route latency histograms, SQL counts, DB time and slow queries (Prometheus format)"""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/admin/cache")
+def get_cache_stats():
+    """Hit/miss counters for the in-process caches, and the audit queue's counters"""
+    stats = {"overview": overview_cache.stats(), "facets": facet_cache.stats()}
+    if CATALOG_SNAPSHOT:
+        stats["catalog"] = catalog.stats()
+    stats["recommendations"] = recommender.stats()
+    # `dropped` is the only sign that the bounded queue is losing audit events
+    stats["audit"] = audit.stats()
+    return stats
+
+
+# ---------- ANALYTICS ----------
+# Served from the rental_stats_daily rollups (see analytics.py), so a report
+# reads O(days x values) rows however long the rental history is
+
+ANALYTICS_WEEKS = 12
+MAX_ANALYTICS_DAYS = 3 * 366
+
+
+def analytics_range(start, end):
+    """Default to the last ANALYTICS_WEEKS whole weeks up to today"""
+    end = end or date.today()
+    start = start or analytics.week_of(end) - timedelta(weeks=ANALYTICS_WEEKS - 1)
+    if end < start:
+        raise HTTPException(status_code=400, detail="end must not be before start")
+    if (end - start).days >= MAX_ANALYTICS_DAYS:
+        raise HTTPException(status_code=400, detail=f"Ranges are limited to {MAX_ANALYTICS_DAYS} days")
+    return start, end
+
+
+async def items_per_value(session, dimension):
+    """Items that can be rented (not retired) per value of `dimension`"""
+    position = FACETS.index(dimension)
+    counts = {}
+    for row in await facet_groups(session):
+        if row[FACETS.index("status")] != "retired":
+            value = row[position] or ""
+            counts[value] = counts.get(value, 0) + row[-1]
+    return counts
+
+
+@app.get("/admin/analytics/utilization", response_model=List[UtilizationOut])
+async def get_utilization(
+    group_by: AnalyticsDimension = "category",
+    start: date = None,
+    end: date = None,
+    session: AsyncSession = Depends(get_db),
+):
+    """Weekly checkouts, returns and share of item-days rented per category, size or brand"""
+    # On the primary: item counts come from the commit-invalidated facet cache
+    start, end = analytics_range(start, end)
+    rows = await analytics.load_days(session, group_by, start, end)
+    opening = await analytics.out_before(session, group_by, start)
+    items = await items_per_value(session, group_by)
+    return json_rows(analytics.weekly_utilization(rows, opening, items, start, end))
+
+
+@app.get("/admin/analytics/lead-time", response_model=List[LeadTimeOut])
+async def get_lead_time(
+    group_by: AnalyticsDimension = "category",
+    start: date = None,
+    end: date = None,
+    session: AsyncSession = Depends(get_read_db),
+):
+    """Weekly mean days from request to checkout per category, size or brand"""
+    start, end = analytics_range(start, end)
+    return json_rows(analytics.lead_times(await analytics.load_days(session, group_by, start, end)))
+
+
+@app.get("/admin/analytics/returns", response_model=List[ReturnLatenessOut])
+async def get_return_lateness(
+    group_by: AnalyticsDimension = "category",
+    start: date = None,
+    end: date = None,
+    session: AsyncSession = Depends(get_read_db),
+):
+    """Weekly rental length and late returns per category, size or brand"""
+    start, end = analytics_range(start, end)
+    return json_rows(analytics.return_lateness(await analytics.load_days(session, group_by, start, end)))
+
+
+@app.get("/admin/analytics/items/{item_id}", response_model=List[ItemUtilizationOut])
+async def get_item_utilization(
+    item_id: int,
+    start: date = None,
+    end: date = None,
+    session: AsyncSession = Depends(get_read_db),
+):
+    """Weekly checkouts, returns and days rented for one item"""
+    start, end = analytics_range(start, end)
+    if await session.get(Item, item_id) is None:
+        raise HTTPException(status_code=404, detail="Item not found")
+    # One item's rentals are an index range (ix_rentals_item_status), so this
+    # reads them directly rather than keeping per-item rollups
+    return json_rows(await analytics.item_utilization(session, item_id, start, end, date.today()))
+
+
+# ---------- AUDIT LOG ----------
+
+@app.get("/logs", response_model=List[LogOut])
+async def get_logs(
+    item_id: int = None,
+    since: datetime = None,
+    after: int = None,
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    response: Response = None,
+    session: AsyncSession = Depends(get_read_db),
+):
+    """Audit trail entries, oldest first, optionally for one item or since a time"""
+    query = select(Log)
+    if item_id is not None:
+        query = query.filter(Log.item_id == item_id)
+    if since is not None:
+        query = query.filter(Log.timestamp >= since)
+    query = paginate(query, Log.log_id, after, limit)
+    logs = next_page((await session.scalars(query)).all(), limit, response, lambda log: log.log_id)
+    return json_rows([
+        {
+            "id": log.log_id,
+            "item_id": log.item_id,
+            "user_id": log.user_id,
+            "timestamp": log.timestamp,
+            "action": log.action,
+        }
+        for log in logs
+    ], response)
 
 
 # ---------- MEMBER ROUTES ----------
 
-@app.get("/members")
-def get_members():
+MEMBER_FIELDS = ["id", "name", "email", "role"]
+
+
+@app.get("/members", response_model=List[MemberOut])
+async def get_members(
+    after: int = None,
+    limit: int = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    fields: str = None,
+    response: Response = None,
+    session: AsyncSession = Depends(get_read_db),
+):
     """Get all members"""
-    session = get_session()
-    members = session.query(Member).all()
-    session.close()
-    return [
-        {
+    fields = parse_fields(fields, MEMBER_FIELDS)
+    query = paginate(select(Member), Member.member_id, after, limit)
+    members = next_page((await session.scalars(query)).all(), limit, response, lambda m: m.member_id)
+    return json_rows([
+        project({
             "id": m.member_id,
             "name": m.name,
             "email": m.email,
             "role": m.role,
-        }
+        }, fields)
         for m in members
-    ]
+    ], response)
+
+
+@app.get("/members/{member_id}/history", response_model=List[RentalOut])
+async def get_member_history(
+    member_id: int,
+    after: int = None,
+    limit: int = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    fields: str = None,
+    response: Response = None,
+    session: AsyncSession = Depends(get_read_db),
+):
+    """A member's rentals, oldest first, with item names; one query on ix_rentals_member"""
+    fields = parse_fields(fields, RENTAL_FIELDS)
+    query = (
+        select(Rental, Item.name, Member.name)
+        .outerjoin(Item, Item.item_id == Rental.item_id)
+        .join(Member, Member.member_id == Rental.member_id)
+        .where(Rental.member_id == member_id)
+    )
+    query = paginate(query, Rental.rental_id, after, limit)
+    rows = next_page((await session.execute(query)).all(), limit, response, lambda row: row[0].rental_id)
+    if not rows and after is None and await session.get(Member, member_id) is None:
+        raise HTTPException(status_code=404, detail="Member not found")
+    return json_rows([project(rental_to_dict(*row), fields) for row in rows], response)
+
+
+@app.get("/members/{member_id}/recommendations", response_model=List[ItemOut])
+async def get_member_recommendations(
+    member_id: int,
+    limit: int = Query(10, ge=1, le=RECOMMENDATION_COUNT),
+    fields: str = None,
+    session: AsyncSession = Depends(get_read_db),
+):
+    """Items people who rented what this member rented also rented, best first"""
+    fields = parse_fields(fields, ITEM_FIELDS)
+    if not recommender.ready:
+        raise HTTPException(
+            status_code=503, detail="Recommendations are still being built", headers={"Retry-After": "5"},
+        )
+    if await session.get(Member, member_id) is None:
+        raise HTTPException(status_code=404, detail="Member not found")
+
+    # The ranking is precomputed; this only loads the candidates by key and
+    # drops items that are out of circulation
+    ranked = recommender.for_member(member_id)
+    query = select_items(fields).where(Item.item_id.in_(ranked), Item.status.not_in(["repair", "retired"]))
+    rows = {row[0]: row for row in await session.execute(query)}
+    return json_rows([item_to_dict(rows[i], fields) for i in ranked if i in rows][:limit])
+
+
+MEMBER_IMPORT_COLUMNS = ["name", "email", "role"]
+MEMBER_ROLES = set(Member.role.type.enums)
+
+
+async def insert_members(session, batch, seen, report):
+    """Insert a batch of members, skipping emails that already exist"""
+    emails = [values["email"] for _, values in batch]
+    existing = set(await session.scalars(select(Member.email).where(Member.email.in_(emails))))
+    rows = []
+    for line, values in batch:
+        if values["email"] in existing or values["email"] in seen:
+            report.error(line, f"Duplicate email: {values['email']}")
+            continue
+        seen.add(values["email"])
+        rows.append(values)
+    await insert_batch(session, Member, rows, report)
+
+
+@app.post("/members/bulk")
+async def bulk_add_members(request: HTTPRequest, session: AsyncSession = Depends(get_db)):
+    """Import members from a streamed CSV or NDJSON body in batched inserts"""
+    report = ImportReport()
+    seen = set()
+    batch = []
+    async for line, row in iter_records(request):
+        if row is None:
+            report.error(line, "Malformed row")
+            continue
+        try:
+            values = clean(row, MEMBER_IMPORT_COLUMNS)
+        except ValueError as exc:
+            report.error(line, str(exc))
+            continue
+        values["role"] = values["role"] or "borrower"
+        if not values["name"] or not values["email"]:
+            report.error(line, "name and email are required")
+        elif values["role"] not in MEMBER_ROLES:
+            report.error(line, f"Invalid role: {values['role']}")
+        else:
+            batch.append((line, values))
+        if len(batch) >= BATCH_SIZE:
+            await insert_members(session, batch, seen, report)
+            batch = []
+    if batch:
+        await insert_members(session, batch, seen, report)
+    return report.as_dict("members")
 
 
 @app.post("/members")
-def add_member(member: dict):
+async def add_member(member: MemberCreate, session: AsyncSession = Depends(get_db)):
     """Add a new member"""
-    session = get_session()
-    new_member = Member(
-        name=member["name"],
-        email=member["email"],
-        role=member.get("role", "borrower"),
-    )
+    new_member = Member(**member.model_dump())
     session.add(new_member)
-    session.commit()
-    session.refresh(new_member)
-    session.close()
+    await session.commit()
+    await session.refresh(new_member)
     return {"message": "✅ Member added!", "member_id": new_member.member_id}
 
 
@@ -0,0 +1,109 @@
+"""
+Append-only audit trail written to the logs table in the background
+
+Routes call `audit.record()`, which only appends to a bounded in-memory
+queue. A writer task started by the app lifespan drains the queue and
+inserts the events in batches, and flushes whatever is left on shutdown.
+"""
+import asyncio
+import logging
+import os
+from datetime import datetime, timezone
+
+from sqlalchemy import insert
+
+from database import AsyncSessionLocal, run_with_retry
+from models import Log
+
+logger = logging.getLogger("wardrobe.audit")
+
+AUDIT_QUEUE_SIZE = int(os.getenv("AUDIT_QUEUE_SIZE", "10000"))
+AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", "500"))
+AUDIT_FLUSH_INTERVAL = float(os.getenv("AUDIT_FLUSH_INTERVAL", "0.5"))
+
+
+class AuditLog:
+    def __init__(self, maxsize=AUDIT_QUEUE_SIZE, batch_size=AUDIT_BATCH_SIZE, flush_interval=AUDIT_FLUSH_INTERVAL):
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.written = 0
+        self.dropped = 0
+        self._batch = []
+        self._task = None
+
+    def record(self, action, item_id=None, user_id=None):
+        """Queue an event without waiting on the database"""
+        event = {
+            "item_id": item_id,
+            "user_id": user_id,
+            "action": action,
+            # Stamped now (UTC, like the column's server default), not at flush
+            "timestamp": datetime.now(timezone.utc).replace(tzinfo=None),
+        }
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            logger.warning("Audit queue full, dropped %s event for item %s", action, item_id)
+
+    async def _write(self):
+        if not self._batch:
+            return
+        async with AsyncSessionLocal() as session:
+
+            async def apply():
+                await session.execute(insert(Log), self._batch)
+                await session.commit()
+
+            await run_with_retry(session, apply)
+        self.written += len(self._batch)
+        self._batch = []
+
+    def _drain(self):
+        while len(self._batch) < self.batch_size and not self.queue.empty():
+            self._batch.append(self.queue.get_nowait())
+
+    async def run(self):
+        """Writer loop: wait for an event, gather more for up to flush_interval, insert"""
+        loop = asyncio.get_running_loop()
+        while True:
+            self._batch.append(await self.queue.get())
+            deadline = loop.time() + self.flush_interval
+            while len(self._batch) < self.batch_size:
+                self._drain()
+                remaining = deadline - loop.time()
+                if remaining <= 0 or len(self._batch) >= self.batch_size:
+                    break
+                try:
+                    self._batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                await self._write()
+            except Exception:
+                logger.exception("Failed to write %d audit events", len(self._batch))
+                self._batch = []
+
+    async def flush(self):
+        """Write everything still queued"""
+        self._drain()
+        while self._batch:
+            await self._write()
+            self._drain()
+
+    def start(self):
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    def stats(self):
+        return {"queued": self.queue.qsize(), "written": self.written, "dropped": self.dropped}
+
+
+audit = AuditLog()
@@ -0,0 +1,120 @@
+"""
+In-memory availability calendar: booked date intervals per item
+
+Intervals are inclusive [start, end] date ranges kept sorted by start date
+for each item, so an overlap check only walks the bookings that start
+before the requested end date. An open rental that is past its expected
+return date holds its item indefinitely: the item is still out, so it
+can't be promised to anyone until it comes back. The index is rebuilt
+from the requests and rentals tables at startup and then kept current by
+the routes that approve, check out and return items.
+"""
+from bisect import insort
+from datetime import date
+
+from sqlalchemy import select
+
+from models import OPEN_RENTAL_STATUSES, Rental, Request
+
+
+class AvailabilityIndex:
+    def __init__(self):
+        self._bookings = {}  # item_id -> sorted list of (start, end, key)
+        self._keys = {}  # key -> item_id
+        self.loaded = False
+
+    def clear(self):
+        self._bookings.clear()
+        self._keys.clear()
+        self.loaded = False
+
+    def add(self, item_id, key, start, end):
+        """Book item_id for [start, end]; an open end books it indefinitely"""
+        self.remove(key)
+        start = start or date.today()
+        end = end or date.max
+        insort(self._bookings.setdefault(item_id, []), (start, end, key))
+        self._keys[key] = item_id
+
+    def remove(self, key):
+        item_id = self._keys.pop(key, None)
+        if item_id is None:
+            return
+        bookings = self._bookings[item_id]
+        bookings[:] = [b for b in bookings if b[2] != key]
+        if not bookings:
+            del self._bookings[item_id]
+
+    @staticmethod
+    def _end(booked_end, key, today):
+        # Decided at read time: a rental becomes past due without any write
+        if key[0] == "rental" and booked_end < today:
+            return date.max
+        return booked_end
+
+    def conflicts(self, item_id, start, end, ignore=()):
+        """Keys of bookings on item_id that overlap [start, end]"""
+        found = []
+        today = date.today()
+        for booked_start, booked_end, key in self._bookings.get(item_id, ()):
+            if booked_start > end:
+                break
+            if self._end(booked_end, key, today) >= start and key not in ignore:
+                found.append(key)
+        return found
+
+    def is_free(self, item_id, start, end, ignore=()):
+        return not self.conflicts(item_id, start, end, ignore)
+
+    def bookings(self, item_id):
+        today = date.today()
+        result = []
+        for start, end, key in self._bookings.get(item_id, []):
+            end = self._end(end, key, today)
+            result.append({"start": str(start), "end": None if end == date.max else str(end), "source": key[0], "id": key[1]})
+        return result
+
+    async def rebuild(self, session):
+        """Load current and future bookings from the database"""
+        self.clear()
+        today = date.today()
+
+        rentals = await session.execute(
+            select(Rental.rental_id, Rental.item_id, Rental.checkout_date, Rental.expected_return_date)
+            .where(Rental.status.in_(OPEN_RENTAL_STATUSES))
+        )
+        for rental_id, item_id, start, end in rentals:
+            self.add(item_id, ("rental", rental_id), start, end)
+
+        # Approved requests stop holding the item once the rental they
+        # produced is returned
+        returned = select(Rental.rental_id).where(
+            Rental.request_id == Request.request_id,
+            Rental.status == "returned",
+        ).exists()
+        requests = await session.execute(
+            select(Request.request_id, Request.item_id, Request.start_date, Request.end_date)
+            .where(
+                Request.status == "approved",
+                Request.start_date.is_not(None),
+                Request.end_date.is_(None) | (Request.end_date >= today),
+                ~returned,
+            )
+        )
+        for request_id, item_id, start, end in requests:
+            self.add(item_id, ("request", request_id), start, end)
+
+        self.loaded = True
+
+    async def ensure_loaded(self, session):
+        if not self.loaded:
+            await self.rebuild(session)
+
+    def release_rental(self, rental):
+        """Free the rental's interval and the approved request that produced it"""
+        self.remove(("rental", rental.rental_id))
+        if rental.request_id is not None:
+            self.remove(("request", rental.request_id))
+
+
+availability = AvailabilityIndex()
@@ -0,0 +1,66 @@
+"""
+Concurrency stress check: many parallel approvals for one item must yield one rental
+
+Runs the app in-process against a throwaway SQLite database (needs
+`pip install httpx`):
+    python benchmarks/approval_stress.py --approvals 300
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--approvals", type=int, default=300)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'stress.db')}"
+
+    import httpx
+    from sqlalchemy import func, select
+
+    from database import SessionLocal, engine
+    from migrate import upgrade
+    upgrade(engine, log=lambda message: None)
+
+    import api
+    from models import Item, Member, Rental, Request
+
+    with SessionLocal() as session:
+        item = Item(name="Stress Test Suit", status="available")
+        members = [Member(name=f"Member {i}", email=f"m{i}@example.com") for i in range(args.approvals)]
+        session.add_all([item, *members])
+        session.flush()
+        requests = [Request(item_id=item.item_id, member_id=m.member_id, status="pending") for m in members]
+        session.add_all(requests)
+        session.commit()
+        item_id = item.item_id
+        request_ids = [r.request_id for r in requests]
+
+    transport = httpx.ASGITransport(app=api.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://stress") as client:
+        responses = await asyncio.gather(*(
+            client.patch(f"/requests/{request_id}", json={"status": "approved"})
+            for request_id in request_ids
+        ))
+
+    with SessionLocal() as session:
+        rentals = session.scalar(select(func.count(Rental.rental_id)).where(Rental.item_id == item_id))
+        status = session.get(Item, item_id).status
+
+    print(f"responses: {dict(Counter(r.status_code for r in responses))}")
+    print(f"rentals for item: {rentals}, item status: {status}")
+    assert rentals == 1, f"expected exactly one rental, found {rentals}"
+    assert sum(r.status_code == 200 for r in responses) == 1
+    print("OK")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
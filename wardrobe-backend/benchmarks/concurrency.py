@@ -0,0 +1,78 @@
+"""
+Throughput benchmark for a running API server at increasing client concurrency
+
+Usage (needs `pip install httpx`):
+    uvicorn api:app --port 8000 --workers 1
+    python benchmarks/concurrency.py --url http://localhost:8000 --concurrency 50 200 1000
+
+Run it once against each stack (e.g. before and after a change, checked out
+side by side) with the same database to compare them.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+import httpx
+
+DEFAULT_PATHS = ["/items", "/items/1", "/requests", "/rentals", "/members"]
+
+
+async def run_level(url, paths, concurrency, total):
+    """Fire `total` GETs spread over `paths` with `concurrency` clients in flight"""
+    latencies = []
+    errors = 0
+    queue = asyncio.Queue()
+    for i in range(total):
+        queue.put_nowait(paths[i % len(paths)])
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=60) as client:
+
+        async def worker():
+            nonlocal errors
+            while not queue.empty():
+                path = queue.get_nowait()
+                start = time.perf_counter()
+                try:
+                    response = await client.get(path)
+                    if response.status_code >= 400:
+                        errors += 1
+                except httpx.HTTPError:
+                    errors += 1
+                latencies.append(time.perf_counter() - start)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "concurrency": concurrency,
+        "requests": total,
+        "errors": errors,
+        "requests_per_sec": round(total / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies) * 1000, 2),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 2),
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[50, 200, 1000])
+    parser.add_argument("--requests", type=int, default=5000, help="requests per concurrency level")
+    parser.add_argument("--paths", nargs="+", default=DEFAULT_PATHS)
+    args = parser.parse_args()
+
+    results = []
+    for level in args.concurrency:
+        result = await run_level(args.url, args.paths, level, max(args.requests, level))
+        print(json.dumps(result))
+        results.append(result)
+    return results
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,186 @@
+"""
+Synthetic data generator for load testing
+
+Creates a database with a realistic shape at any scale: members, items,
+several years of returned rentals, a slice of current and overdue
+rentals, and pending/approved/rejected requests. Rows are written with
+batched executemany inserts, then the analytics rollups are built from
+the rentals.
+
+Usage:
+    python benchmarks/generate_data.py --db bench.db --items 100000 --years 3
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import insert
+
+from database import make_engine
+from migrate import rebuild_rollups, upgrade
+from models import Item, Member, Rental, Request
+
+BATCH_SIZE = 5000
+
+CATEGORIES = ["Women's Formal", "Men's Formal", "Accessories", "Outerwear", "Shoes", "Business Casual"]
+SIZES = ["XS", "S", "M", "L", "XL", "38R", "40R", "42R", "44R", "One Size"]
+COLORS = ["Black", "Navy", "Gray", "White", "Pink", "Red", "Green", "Blue", "Brown", "Silver"]
+BRANDS = [
+    "Ann Taylor", "Calvin Klein", "J.Crew", "Reformation", "Banana Republic", "Hugo Boss",
+    "Ralph Lauren", "Brooks Brothers", "Coach", "Tumi", "Timex", "Zara", "Theory", "Uniqlo",
+]
+GARMENTS = ["Suit", "Blazer", "Dress", "Tuxedo", "Pant Suit", "Tie", "Belt", "Scarf", "Coat", "Heels"]
+PURPOSES = ["Job interview", "Career fair", "Networking event", "Formal", "Presentation", None]
+
+
+def batches(rows, size=BATCH_SIZE):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def insert_rows(engine, model, rows):
+    count = 0
+    with engine.begin() as conn:
+        for batch in batches(rows):
+            conn.execute(insert(model), batch)
+            count += len(batch)
+    return count
+
+
+def generate(db, items, members, years, rentals_per_year, seed):
+    rng = random.Random(seed)
+    today = date.today()
+    first_day = today - timedelta(days=365 * years)
+
+    for path in (db, f"{db}-wal", f"{db}-shm"):
+        if os.path.exists(path):
+            os.remove(path)
+    engine = make_engine(f"sqlite:///{db}")
+    upgrade(engine, log=lambda message: None)
+
+    def member_rows():
+        for i in range(members):
+            yield {
+                "member_id": i + 1,
+                "name": f"Member {i + 1}",
+                "email": f"member{i + 1}@example.edu",
+                "role": "staff" if i % 50 == 0 else "borrower",
+            }
+
+    # Roughly 8% of items are out right now; a few are in repair or retired
+    statuses = rng.choices(["available", "rented", "repair", "retired"], [88, 8, 3, 1], k=items)
+
+    def item_rows():
+        for i in range(items):
+            color, garment = rng.choice(COLORS), rng.choice(GARMENTS)
+            yield {
+                "item_id": i + 1,
+                "name": f"{color} {garment} #{i + 1}",
+                "category": rng.choice(CATEGORIES),
+                "size": rng.choice(SIZES),
+                "color": color,
+                "brand": rng.choice(BRANDS),
+                "status": statuses[i],
+                "image_url": "/placeholder.svg",
+            }
+
+    def history_rows():
+        """Back-to-back returned rentals per item, then one open rental if rented"""
+        for item_id in range(1, items + 1):
+            day = first_day
+            while True:
+                checkout = day + timedelta(days=int(rng.expovariate(rentals_per_year / 365)))
+                expected = checkout + timedelta(days=rng.randint(2, 10))
+                actual = expected + timedelta(days=rng.choice([0, 0, 0, 0, 1, 2, 5]))
+                if actual >= today - timedelta(days=14):
+                    break
+                yield {
+                    "item_id": item_id,
+                    "member_id": rng.randint(1, members),
+                    "checkout_date": checkout,
+                    "expected_return_date": expected,
+                    "actual_return_date": actual,
+                    "status": "returned",
+                }
+                day = actual
+            if statuses[item_id - 1] == "rented":
+                checkout = today - timedelta(days=rng.randint(0, 14))
+                expected = checkout + timedelta(days=rng.randint(3, 10))
+                yield {
+                    "item_id": item_id,
+                    "member_id": rng.randint(1, members),
+                    "checkout_date": checkout,
+                    "expected_return_date": expected,
+                    "actual_return_date": None,
+                    "status": "checked_out",
+                }
+
+    def request_rows():
+        # One request per ~2 historical rentals plus a live queue of pending ones
+        total = int(items * rentals_per_year * years / 2) + items // 20
+        for _ in range(total):
+            requested = first_day + timedelta(days=rng.randrange((today - first_day).days + 1))
+            start = requested + timedelta(days=rng.randint(1, 14))
+            status = "pending" if requested > today - timedelta(days=7) else rng.choice(["approved"] * 4 + ["rejected"])
+            yield {
+                "item_id": rng.randint(1, items),
+                "member_id": rng.randint(1, members),
+                "request_date": requested,
+                "start_date": start,
+                "end_date": start + timedelta(days=rng.randint(2, 10)),
+                "purpose": rng.choice(PURPOSES),
+                "status": status,
+            }
+
+    counts = {}
+    for name, model, rows in [
+        ("members", Member, member_rows()),
+        ("items", Item, item_rows()),
+        ("rentals", Rental, history_rows()),
+        ("requests", Request, request_rows()),
+    ]:
+        started = time.perf_counter()
+        counts[name] = insert_rows(engine, model, rows)
+        print(f"{name}: {counts[name]} rows in {time.perf_counter() - started:.1f}s")
+
+    started = time.perf_counter()
+    counts["rollups"] = rebuild_rollups(engine, chunk_size=50000, pause=0)
+    print(f"rollups: {counts['rollups']} rows in {time.perf_counter() - started:.1f}s")
+
+    engine.dispose()
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default="bench.db", help="SQLite file to (re)create")
+    parser.add_argument("--items", type=int, default=1000)
+    parser.add_argument("--members", type=int, default=None, help="defaults to items / 5")
+    parser.add_argument("--years", type=int, default=2, help="years of rental history")
+    parser.add_argument("--rentals-per-year", type=float, default=6, help="average rentals per item per year")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    generate(
+        args.db,
+        args.items,
+        args.members or max(10, args.items // 5),
+        args.years,
+        args.rentals_per_year,
+        args.seed,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""
+In-process benchmark harness for the API routes
+
+Drives the FastAPI app through an ASGI client (no server or network) against
+a generated database and reports, per endpoint, p50/p95/p99 latency,
+requests/sec and SQL statements per request. Results are written as JSON so
+runs from different commits can be compared.
+
+Usage (needs `pip install httpx`):
+    python benchmarks/generate_data.py --db bench.db --items 100000
+    python benchmarks/run_benchmarks.py --db bench.db --requests 200
+    python benchmarks/run_benchmarks.py --db bench.db --compare benchmarks/results/<old>.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND)
+
+RESULTS_DIR = os.path.join(BACKEND, "benchmarks", "results")
+
+
+def default_endpoints():
+    start = date.today() + timedelta(days=30)
+    end = start + timedelta(days=5)
+    return [
+        "/items?limit=100",
+        "/items?fields=id,name,image_url,status&limit=100",
+        "/items?category=Formal&size=M&limit=100",
+        "/items/search?q=navy%20sui",
+        "/items/1",
+        f"/items/available?start={start}&end={end}&size=M&category=Accessories",
+        "/requests?limit=100",
+        "/rentals?limit=100",
+        "/members?limit=100",
+        "/admin/overview",
+    ]
+
+
+def percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def bench_endpoint(client, statements, path, total, concurrency):
+    # Count statements on one isolated call so concurrent requests don't mix
+    statements[0] = 0
+    first = await client.get(path)
+    per_request = statements[0]
+
+    latencies = []
+    errors = 0 if first.status_code < 400 else 1
+    remaining = iter(range(total))
+
+    async def worker():
+        nonlocal errors
+        for _ in remaining:
+            started = time.perf_counter()
+            response = await client.get(path)
+            latencies.append(time.perf_counter() - started)
+            if response.status_code >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "endpoint": path,
+        "requests": total,
+        "concurrency": concurrency,
+        "errors": errors,
+        "requests_per_sec": round(total / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "sql_statements": per_request,
+        "response_bytes": len(first.content),
+    }
+
+
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = {r["endpoint"]: r for r in json.load(f)["results"]}
+    print(f"\nvs {baseline_path}")
+    for result in results:
+        old = baseline.get(result["endpoint"])
+        if not old:
+            continue
+        change = (result["p95_ms"] - old["p95_ms"]) / old["p95_ms"] * 100 if old["p95_ms"] else 0
+        print(
+            f"{result['endpoint']:<70} p95 {old['p95_ms']:>9.2f} -> {result['p95_ms']:>9.2f} ms "
+            f"({change:+.0f}%)  sql {old['sql_statements']} -> {result['sql_statements']}"
+        )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default="bench.db", help="database made by generate_data.py")
+    parser.add_argument("--requests", type=int, default=200, help="timed requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--endpoint", action="append", help="endpoint to run (repeatable); defaults to a standard set")
+    parser.add_argument("--output", help="results file (default: benchmarks/results/<time>-<rev>.json)")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        sys.exit(f"{args.db} not found; create it with benchmarks/generate_data.py")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.abspath(args.db)}"
+
+    import httpx
+    from sqlalchemy import event
+
+    import api
+
+    statements = [0]
+
+    @event.listens_for(api.async_engine.sync_engine, "before_cursor_execute")
+    def count_statement(*_):
+        statements[0] += 1
+
+    results = []
+    async with api.app.router.lifespan_context(api.app):
+        transport = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            for path in args.endpoint or default_endpoints():
+                result = await bench_endpoint(client, statements, path, args.requests, args.concurrency)
+                results.append(result)
+                print(
+                    f"{path:<70} p50 {result['p50_ms']:>8.2f}  p95 {result['p95_ms']:>8.2f}  "
+                    f"p99 {result['p99_ms']:>8.2f} ms  {result['requests_per_sec']:>8.1f} req/s  "
+                    f"sql {result['sql_statements']}"
+                )
+
+    revision = git_revision()
+    report = {
+        "revision": revision,
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "database": os.path.abspath(args.db),
+        "settings": {"requests": args.requests, "concurrency": args.concurrency},
+        "results": results,
+    }
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"{datetime.now():%Y%m%d-%H%M%S}-{revision or 'norev'}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nsaved {output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,73 @@
+"""
+Serialization cost of a large item list, per encoding path
+
+Loads --items rows with the same select the /items route uses, then times
+turning them into a JSON body the ways FastAPI can:
+
+  jsonable_encoder   dicts -> jsonable_encoder -> json.dumps (plain routes)
+  response_model     dicts -> validate against List[ItemOut] -> dump -> orjson
+  orjson             dicts -> orjson.dumps (what the list routes do now)
+
+Usage:
+    python benchmarks/generate_data.py --db bench.db --items 10000
+    python benchmarks/serialization.py --db bench.db --items 10000
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from typing import List
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND)
+
+
+def timed(encode, repeat):
+    encode()
+    started = time.perf_counter()
+    for _ in range(repeat):
+        body = encode()
+    return (time.perf_counter() - started) / repeat, len(body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default="bench.db", help="database made by generate_data.py")
+    parser.add_argument("--items", type=int, default=10000, help="rows per list")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        sys.exit(f"{args.db} not found; create it with benchmarks/generate_data.py")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.abspath(args.db)}"
+
+    import orjson
+    from fastapi.encoders import jsonable_encoder
+    from pydantic import TypeAdapter
+
+    from api import item_to_dict, select_items
+    from database import make_engine
+    from models import Item
+    from schemas import ItemOut
+
+    engine = make_engine(os.environ["DATABASE_URL"])
+    with engine.connect() as conn:
+        rows = conn.execute(select_items().order_by(Item.item_id).limit(args.items)).all()
+    engine.dispose()
+    items = [item_to_dict(row) for row in rows]
+    adapter = TypeAdapter(List[ItemOut])
+
+    paths = {
+        "jsonable_encoder": lambda: json.dumps(jsonable_encoder(items)).encode(),
+        "response_model": lambda: orjson.dumps(adapter.dump_python(adapter.validate_python(items), mode="json")),
+        "orjson": lambda: orjson.dumps(items),
+    }
+    print(f"{len(items)} items, mean of {args.repeat} runs")
+    for name, encode in paths.items():
+        seconds, size = timed(encode, args.repeat)
+        print(f"{name:<18} {seconds * 1000:>8.1f} ms  {size:>10} bytes")
+
+
+if __name__ == "__main__":
+    main()
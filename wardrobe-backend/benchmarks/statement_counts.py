@@ -0,0 +1,116 @@
+"""
+Regression check: list and detail routes issue a fixed number of SQL statements
+
+Generates databases at two sizes and fails (exit status 1) unless every
+endpoint in EXPECTED issues exactly its expected number of statements at
+both, so an N+1 query that creeps back in breaks the check instead of only
+showing up in a benchmark report. Counts are taken on a second, warm call
+to each endpoint, after startup work (availability index, recommendations)
+has finished.
+
+Needs `pip install httpx`:
+    python benchmarks/statement_counts.py
+    python benchmarks/statement_counts.py --sizes 500,5000
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Endpoint -> statements per warm request, whatever the data size
+EXPECTED = {
+    "/requests?limit=100": 1,
+    "/requests/1": 3,  # the request, then its item and member by primary key
+    "/rentals?limit=100": 1,
+    "/rentals/overdue?limit=100": 1,
+    "/members?limit=100": 1,
+    "/members/1/history?limit=100": 1,
+    "/items?limit=100": 1,
+    "/items/1": 1,
+    "/logs?limit=100": 1,
+}
+
+
+async def measure(db, paths):
+    """Statements per warm request for each path, against an existing database"""
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.abspath(db)}"
+    # Periodic jobs would add their own statements to the count
+    os.environ["OVERDUE_SWEEP_INTERVAL"] = "0"
+    os.environ["RECOMMENDATION_REFRESH_INTERVAL"] = "0"
+
+    import httpx
+    from sqlalchemy import event
+
+    import api
+
+    statements = [0]
+
+    @event.listens_for(api.async_engine.sync_engine, "before_cursor_execute")
+    def count_statement(*_):
+        statements[0] += 1
+
+    counts = {}
+    async with api.app.router.lifespan_context(api.app):
+        while not api.recommender.ready:
+            await asyncio.sleep(0.05)
+        transport = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://check") as client:
+            for path in paths:
+                await client.get(path)
+                statements[0] = 0
+                response = await client.get(path)
+                response.raise_for_status()
+                counts[path] = statements[0]
+    return counts
+
+
+def count_at_size(workdir, items, seed):
+    from generate_data import generate
+
+    db = os.path.join(workdir, f"check-{items}.db")
+    with contextlib.redirect_stdout(io.StringIO()):
+        generate(db, items, max(10, items // 5), 1, 6, seed)
+    # A fresh process per database: the app binds its engine at import
+    output = subprocess.check_output(
+        [sys.executable, os.path.abspath(__file__), "--measure", db, *EXPECTED],
+    )
+    return json.loads(output)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="200,2000", help="comma-separated item counts to generate")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--measure", nargs="+", metavar=("DB", "PATH"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        db, *paths = args.measure
+        print(json.dumps(asyncio.run(measure(db, paths))))
+        return
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    with tempfile.TemporaryDirectory() as workdir:
+        by_size = {items: count_at_size(workdir, items, args.seed) for items in sizes}
+
+    failures = 0
+    print(f"{'endpoint':<32} {'expected':>8}  " + "  ".join(f"{items:>7} items" for items in sizes))
+    for path, expected in EXPECTED.items():
+        counts = [by_size[items][path] for items in sizes]
+        ok = all(count == expected for count in counts)
+        failures += not ok
+        print(f"{path:<32} {expected:>8}  " + "  ".join(f"{count:>13}" for count in counts) + ("" if ok else "  FAIL"))
+    if failures:
+        sys.exit(f"\n{failures} endpoint(s) issued an unexpected number of SQL statements")
+    print("\nStatement counts are constant across data sizes")
+
+
+if __name__ == "__main__":
+    main()
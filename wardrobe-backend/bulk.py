@@ -0,0 +1,116 @@
+"""
+Streaming CSV / NDJSON parsing and encoding for bulk import and export
+"""
+import csv
+import io
+import json
+
+from fastapi import HTTPException
+
+BATCH_SIZE = 1000
+
+CSV_TYPE = "text/csv"
+NDJSON_TYPE = "application/x-ndjson"
+
+
+def body_format(content_type):
+    """Pick the parser from the request Content-Type"""
+    content_type = (content_type or "").lower()
+    if "csv" in content_type:
+        return "csv"
+    if "ndjson" in content_type or "jsonl" in content_type or "json" in content_type:
+        return "ndjson"
+    raise HTTPException(
+        status_code=415,
+        detail=f"Send the body as {CSV_TYPE} or {NDJSON_TYPE}",
+    )
+
+
+async def iter_lines(request):
+    """Yield decoded lines from the request body as it arrives"""
+    pending = b""
+    async for chunk in request.stream():
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            yield line.decode("utf-8-sig").rstrip("\r")
+    if pending:
+        yield pending.decode("utf-8-sig").rstrip("\r")
+
+
+async def iter_csv_records(lines):
+    """Group lines into CSV records; a record ends once its quotes balance"""
+    record = []
+    quotes = 0
+    async for line in lines:
+        record.append(line)
+        quotes += line.count('"')
+        if quotes % 2 == 0:
+            yield next(csv.reader(["\n".join(record)]), [])
+            record, quotes = [], 0
+    if record:
+        yield next(csv.reader(["\n".join(record)]), [])
+
+
+async def iter_records(request):
+    """Yield (line_number, dict) for every row of a CSV or NDJSON body"""
+    fmt = body_format(request.headers.get("content-type"))
+    lines = iter_lines(request)
+
+    if fmt == "ndjson":
+        number = 0
+        async for line in lines:
+            number += 1
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield number, row if isinstance(row, dict) else None
+        return
+
+    header = None
+    number = 0
+    async for values in iter_csv_records(lines):
+        number += 1
+        if not any(v.strip() for v in values):
+            continue
+        if header is None:
+            header = [h.strip() for h in values]
+            continue
+        yield number, dict(zip(header, values))
+
+
+def clean(row, columns):
+    """Keep known columns, turning blank CSV cells into NULLs
+
+    Every import column is a string column: NDJSON numbers are kept as
+    their text, and any other non-null value raises ValueError.
+    """
+    result = {}
+    for column in columns:
+        value = row.get(column)
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            value = str(value)
+        elif value is not None and not isinstance(value, str):
+            raise ValueError(f"{column} must be a string")
+        if isinstance(value, str):
+            value = value.strip() or None
+        result[column] = value
+    return result
+
+
+def encode_csv_rows(columns, rows, header=False):
+    """Encode a batch of rows as CSV text"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(columns)
+    writer.writerows(rows)
+    return buffer.getvalue()
+
+
+def encode_ndjson_rows(columns, rows):
+    """Encode a batch of rows as newline-delimited JSON"""
+    return "".join(json.dumps(dict(zip(columns, row)), default=str) + "\n" for row in rows)
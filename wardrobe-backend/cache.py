@@ -0,0 +1,40 @@
+"""
+Small in-process TTL cache with hit/miss counters
+"""
+import time
+
+
+class TTLCache:
+    """Keep values for `ttl` seconds; cleared early when the data changes"""
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._entries = {}
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry and entry[0] > time.monotonic():
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        return None
+
+    def set(self, key, value):
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+
+    def clear(self):
+        self._entries.clear()
+        self.invalidations += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+            "ttl_seconds": self.ttl,
+        }
@@ -0,0 +1,190 @@
+"""
+In-memory snapshot of the item catalog for filtered list reads
+
+Items are held as `__slots__` records in primary-key order, with secondary
+indexes (value -> ids) on category, size, color, brand and status. The
+snapshot is loaded once, then kept current incrementally: commits mark the
+item ids they touched as dirty (see changes.on_commit_keys), and the next
+read reloads just those rows in one query before answering from memory.
+"""
+import asyncio
+from bisect import bisect_right, insort
+from itertools import islice
+from operator import attrgetter
+
+INDEXED = ("category", "size", "color", "brand", "status")
+
+# A filtered read sorts its matches when they are this small a share of the
+# catalog; otherwise it walks the ids in order and keeps the matches
+SORT_FRACTION = 8
+
+
+class CatalogItem:
+    __slots__ = ("id", "name", "category", "size", "color", "brand", "status", "image_url", "rental_end_date")
+
+
+class CatalogSnapshot:
+    def __init__(self, select_rows, fields):
+        """`select_rows()` selects (item_id, *fields) rows, like select_items()"""
+        self.select_rows = select_rows
+        self.fields = fields
+        self.items = {}
+        self.ids = []
+        self.indexes = {name: {} for name in INDEXED}
+        self._values = {}
+        self.loaded = False
+        self.dirty = set()
+        self.load_new = False
+        self.reloads = 0
+        self._lock = asyncio.Lock()
+
+    # ---------- keeping it current ----------
+
+    def mark_changed(self, item_ids=(), inserted=False, unknown=False):
+        """Called at commit time; no I/O, the next read catches up"""
+        self.dirty.update(i for i in item_ids if i is not None)
+        self.load_new = self.load_new or inserted
+        if unknown:
+            self.loaded = False
+
+    async def ensure_fresh(self, session):
+        if self.loaded and not self.dirty and not self.load_new:
+            return
+        async with self._lock:
+            if not self.loaded:
+                # Anything marked before this point is covered by the full load
+                self.dirty.clear()
+                self.load_new = False
+                await self._load(session, None)
+                self.loaded = True
+                return
+            if self.load_new:
+                self.load_new = False
+                await self._load(session, self.ids[-1] if self.ids else None, new_only=True)
+            if self.dirty:
+                # Take the set first: ids marked while the query runs stay for the next read
+                ids, self.dirty = self.dirty, set()
+                await self._load(session, ids)
+
+    async def _load(self, session, ids, new_only=False):
+        query = self.select_rows()
+        key = query.selected_columns[0]
+        if new_only:
+            if ids is not None:
+                query = query.filter(key > ids)
+        elif ids is None:
+            self._clear()
+        else:
+            query = query.filter(key.in_(ids))
+        rows = (await session.execute(query)).all()
+        seen = set()
+        for row in rows:
+            self._put(row)
+            seen.add(row[0])
+        if ids is not None and not new_only:
+            for item_id in set(ids) - seen:
+                self._remove(item_id)
+        self.reloads += 1
+
+    def _clear(self):
+        self.items.clear()
+        self.ids.clear()
+        for index in self.indexes.values():
+            index.clear()
+        self._values.clear()
+
+    def _put(self, row):
+        item_id = row[0]
+        self._remove(item_id)
+        item = CatalogItem()
+        item.id = item_id
+        # row is (item_id, id, name, ...) in self.fields order
+        for name, value in zip(self.fields[1:], row[2:]):
+            index = self.indexes.get(name)
+            if index is not None:
+                # Share one string object per distinct value across all items
+                value = self._values.setdefault(value, value)
+                index.setdefault(value, set()).add(item_id)
+            setattr(item, name, value)
+        self.items[item_id] = item
+        if self.ids and item_id > self.ids[-1]:
+            self.ids.append(item_id)
+        else:
+            insort(self.ids, item_id)
+
+    def _remove(self, item_id):
+        item = self.items.pop(item_id, None)
+        if item is None:
+            return
+        for name, index in self.indexes.items():
+            value = getattr(item, name)
+            ids = index.get(value)
+            if ids is not None:
+                ids.discard(item_id)
+                if not ids:
+                    del index[value]
+        position = bisect_right(self.ids, item_id) - 1
+        if position >= 0 and self.ids[position] == item_id:
+            del self.ids[position]
+
+    # ---------- reads ----------
+
+    def query(self, filters, after=None, limit=None):
+        """Items matching `filters` in id order; same semantics as the /items SQL filters
+
+        `filters` maps an indexed column to (value, exact); exact=False is a
+        case-insensitive substring match, like ILIKE '%value%'.
+        """
+        # Each filter matches one or more index entries (several for substrings,
+        # e.g. "formal"); start from the smallest and probe the others
+        candidates = []
+        for name, (value, exact) in filters.items():
+            index = self.indexes[name]
+            if exact:
+                sets = [index[value]] if value in index else []
+            else:
+                needle = value.lower()
+                sets = [ids for key, ids in index.items() if key is not None and needle in key.lower()]
+            if not sets:
+                return []
+            candidates.append(sets)
+
+        matches = None
+        if candidates:
+            candidates.sort(key=lambda sets: sum(map(len, sets)))
+            first, rest = candidates[0], candidates[1:]
+            matches = first[0] if len(first) == 1 else set().union(*first)
+            for sets in rest:
+                matches = set().union(*(matches & ids for ids in sets))
+            if not matches:
+                return []
+
+        start = bisect_right(self.ids, after) if after is not None else 0
+        if matches is None:
+            ids = self.ids[start:start + limit] if limit else self.ids[start:]
+        elif len(matches) * SORT_FRACTION < len(self.ids):
+            ids = sorted(i for i in matches if after is None or i > after)[:limit]
+        else:
+            ids = []
+            for item_id in islice(self.ids, start, None):
+                if item_id in matches:
+                    ids.append(item_id)
+                    if limit and len(ids) >= limit:
+                        break
+
+        return [self.items[i] for i in ids]
+
+    def as_dict(self, item, fields=None):
+        """Build an item response, like item_to_dict() does for a SQL row"""
+        fields = fields or self.fields
+        values = attrgetter(*fields)(item)
+        return dict(zip(fields, values)) if len(fields) > 1 else {fields[0]: values}
+
+    def stats(self):
+        return {
+            "loaded": self.loaded,
+            "items": len(self.items),
+            "dirty": len(self.dirty),
+            "reloads": self.reloads,
+            "distinct": {name: len(index) for name, index in self.indexes.items()},
+        }
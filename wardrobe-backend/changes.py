@@ -0,0 +1,112 @@
+"""
+Track which tables a session writes to and notify listeners after commit
+
+Caches and other derived state subscribe with `on_commit` instead of every
+route remembering to invalidate them by hand. Each table also has a version
+counter, bumped on every committed write, that HTTP validators are built from.
+
+State kept per row can also ask for the keys that changed: `track_keys`
+names a column to collect from every flushed row of a table, and
+`on_commit_keys` listeners receive them. Set-based statements can't be
+seen row by row, so their callers report keys with `touch`; an INSERT or
+an unreported UPDATE/DELETE is passed on as such.
+"""
+from collections import defaultdict
+from itertools import chain
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+_listeners = []
+_key_listeners = []
+_tracked = {}  # table -> attribute collected from its flushed rows
+_versions = defaultdict(int)
+
+
+def on_commit(callback):
+    """Register callback(tables) to run after a commit that changed `tables`"""
+    _listeners.append(callback)
+    return callback
+
+
+def on_commit_keys(callback):
+    """Register callback(keys, inserted, unknown) for tracked tables after commit
+
+    `keys` maps table -> changed key values; `inserted` holds tables written by
+    set-based INSERTs and `unknown` tables with unreported set-based writes.
+    """
+    _key_listeners.append(callback)
+    return callback
+
+
+def track_keys(table, attribute):
+    """Collect `attribute` from each flushed row of `table` for on_commit_keys"""
+    _tracked[table] = attribute
+
+
+def touch(session, table, *keys):
+    """Report the keys a set-based statement on a tracked table changed"""
+    session.info.setdefault("changed_keys", defaultdict(set))[table].update(keys)
+    session.info.setdefault("touched_tables", set()).add(table)
+
+
+def version(*tables):
+    """Current change counters for `tables`, in order"""
+    return tuple(_versions[table] for table in tables)
+
+
+def _changed(session):
+    return session.info.setdefault("changed_tables", set())
+
+
+@event.listens_for(Session, "after_flush")
+def _track_flush(session, flush_context):
+    tables = _changed(session)
+    for obj in chain(session.new, session.dirty, session.deleted):
+        table = obj.__table__.name
+        tables.add(table)
+        if table in _tracked:
+            # Read the loaded state directly so nothing is lazy-loaded here
+            key = inspect(obj).dict.get(_tracked[table])
+            session.info.setdefault("changed_keys", defaultdict(set))[table].add(key)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _track_statement(orm_execute_state):
+    # Set-based UPDATE/INSERT/DELETE statements bypass the flush
+    if orm_execute_state.is_update or orm_execute_state.is_delete or orm_execute_state.is_insert:
+        mapper = orm_execute_state.bind_mapper
+        if mapper is not None:
+            session = orm_execute_state.session
+            table = mapper.local_table.name
+            _changed(session).add(table)
+            if table in _tracked:
+                kind = "bulk_inserts" if orm_execute_state.is_insert else "bulk_writes"
+                session.info.setdefault(kind, set()).add(table)
+
+
+def _pop_keys(session):
+    keys = session.info.pop("changed_keys", {})
+    inserted = session.info.pop("bulk_inserts", set())
+    unknown = session.info.pop("bulk_writes", set()) - session.info.pop("touched_tables", set())
+    return keys, inserted, unknown
+
+
+@event.listens_for(Session, "after_commit")
+def _notify(session):
+    tables = session.info.pop("changed_tables", None)
+    keys, inserted, unknown = _pop_keys(session)
+    if tables:
+        for table in tables:
+            _versions[table] += 1
+        for callback in _listeners:
+            callback(frozenset(tables))
+    if keys or inserted or unknown:
+        for callback in _key_listeners:
+            callback(dict(keys), frozenset(inserted), frozenset(unknown))
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard(session):
+    session.info.pop("changed_tables", None)
+    _pop_keys(session)
@@ -0,0 +1,136 @@
+"""
+Database engine, session factory and connection tuning for the API
+"""
+import asyncio
+import os
+import random
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+# ---------- Configuration ----------
+# All settings can be overridden through environment variables (or .env via
+# the shell) so deployments can tune the pool without code changes.
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///wardrobe.db")
+
+# Optional replica that read-only routes query instead of the primary
+# (e.g. a PostgreSQL streaming replica); unset means everything uses DATABASE_URL
+READ_REPLICA_URL = os.getenv("READ_REPLICA_URL") or None
+
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_ECHO = os.getenv("DB_ECHO", "false").lower() == "true"
+
+# Retries for write transactions that hit SQLite's "database is locked"
+DB_BUSY_RETRIES = int(os.getenv("DB_BUSY_RETRIES", "5"))
+DB_RETRY_BACKOFF = float(os.getenv("DB_RETRY_BACKOFF", "0.05"))
+
+# SQLite connection pragmas. WAL lets readers proceed while a writer holds
+# the lock; an empty value leaves SQLite's default in place.
+SQLITE_PRAGMAS = {
+    "journal_mode": os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "busy_timeout": os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"),
+    "mmap_size": os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)),
+}
+
+
+# Async drivers used by the API for each sync URL scheme
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+}
+
+
+def async_url(url):
+    """Map a sync database URL onto the matching async driver"""
+    scheme, sep, rest = url.partition("://")
+    return ASYNC_DRIVERS.get(scheme, scheme) + sep + rest
+
+
+def engine_options(url):
+    """Pool and driver options shared by the sync and async engines"""
+    options = {"echo": DB_ECHO}
+    if ":memory:" not in url:
+        options.update(
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+        )
+    if url.startswith("sqlite"):
+        options["connect_args"] = {"check_same_thread": False}
+    else:
+        options["pool_pre_ping"] = True
+    return options
+
+
+def apply_sqlite_pragmas(engine):
+    """Apply SQLITE_PRAGMAS on every new connection of a (sync) engine"""
+    if engine.dialect.name != "sqlite":
+        return
+
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in SQLITE_PRAGMAS.items():
+            if value:
+                cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+
+def make_engine(url=DATABASE_URL):
+    """Create the pooled sync engine used for schema setup and scripts"""
+    engine = create_engine(url, **engine_options(url))
+    apply_sqlite_pragmas(engine)
+    return engine
+
+
+def make_async_engine(url=DATABASE_URL):
+    """Create the pooled async engine (aiosqlite / asyncpg) used by the routes"""
+    engine = create_async_engine(async_url(url), **engine_options(url))
+    apply_sqlite_pragmas(engine.sync_engine)
+    return engine
+
+
+engine = make_engine()
+SessionLocal = sessionmaker(bind=engine)
+
+async_engine = make_async_engine()
+AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False)
+
+replica_engine = make_async_engine(READ_REPLICA_URL) if READ_REPLICA_URL else async_engine
+ReadSessionLocal = async_sessionmaker(replica_engine, expire_on_commit=False)
+
+
+async def get_db():
+    """FastAPI dependency: one async session per request, always closed afterwards"""
+    async with AsyncSessionLocal() as session:
+        yield session
+
+
+async def get_read_db():
+    """Like get_db, but on the read replica when one is configured; for routes that never write"""
+    async with ReadSessionLocal() as session:
+        yield session
+
+
+def is_busy_error(exc):
+    """True for SQLite lock contention errors that are safe to retry"""
+    message = str(exc.orig).lower()
+    return "database is locked" in message or "database is busy" in message
+
+
+async def run_with_retry(session, operation, attempts=DB_BUSY_RETRIES):
+    """Run a write transaction, rolling back and retrying it on lock contention"""
+    for attempt in range(attempts):
+        try:
+            return await operation()
+        except OperationalError as exc:
+            if not is_busy_error(exc) or attempt == attempts - 1:
+                raise
+            await session.rollback()
+            await asyncio.sleep(DB_RETRY_BACKOFF * 2 ** attempt * random.uniform(0.5, 1.5))
@@ -0,0 +1,115 @@
+"""
+In-process pub/sub for live updates, streamed to clients as Server-Sent Events
+
+Write routes call `broker.publish()` after they commit. Each message is
+encoded once and offered to every subscriber's pending buffer, keyed by
+what it describes (e.g. ("item", 42)), so a newer status for the same item
+replaces the one a slow client hasn't read yet. A client that still falls
+more than EVENT_BUFFER_SIZE distinct keys behind has its buffer dropped and
+receives a single `resync` event telling it to refetch instead.
+"""
+import asyncio
+import json
+import os
+
+from fastapi.middleware.gzip import GZipMiddleware
+
+EVENT_BUFFER_SIZE = int(os.getenv("EVENT_BUFFER_SIZE", "256"))
+EVENT_HEARTBEAT = float(os.getenv("EVENT_HEARTBEAT", "15"))
+
+# Tells the browser how long to wait before reconnecting, then a comment
+# that keeps idle connections open through proxies
+RETRY = b"retry: 3000\n\n"
+HEARTBEAT = b": ping\n\n"
+RESYNC = b"event: resync\ndata: {}\n\n"
+
+
+def encode(kind, data):
+    return f"event: {kind}\ndata: {json.dumps(data, default=str)}\n\n".encode()
+
+
+class Subscriber:
+    __slots__ = ("pending", "overflowed", "ready")
+
+    def __init__(self):
+        self.pending = {}  # key -> encoded message, oldest first
+        self.overflowed = False
+        self.ready = asyncio.Event()
+
+    def take(self):
+        chunk = b"".join(self.pending.values())
+        if self.overflowed:
+            chunk = RESYNC + chunk
+        self.pending.clear()
+        self.overflowed = False
+        self.ready.clear()
+        return chunk
+
+
+class Broker:
+    def __init__(self, buffer_size=EVENT_BUFFER_SIZE):
+        self.buffer_size = buffer_size
+        self.subscribers = set()
+        self.published = 0
+        self.coalesced = 0
+        self.overflows = 0
+
+    def publish(self, kind, data, key=None):
+        """Queue an event for every connected client without waiting on any of them"""
+        self.published += 1
+        if not self.subscribers:
+            return
+        key = key or (kind, data.get("id"))
+        message = encode(kind, data)
+        for sub in self.subscribers:
+            if key in sub.pending:
+                # Re-insert so the buffer stays in order of the latest change
+                del sub.pending[key]
+                self.coalesced += 1
+            elif len(sub.pending) >= self.buffer_size:
+                sub.pending.clear()
+                sub.overflowed = True
+                self.overflows += 1
+            sub.pending[key] = message
+            sub.ready.set()
+
+    async def stream(self):
+        """Yield SSE chunks for one client until it disconnects"""
+        sub = Subscriber()
+        self.subscribers.add(sub)
+        try:
+            yield RETRY
+            while True:
+                try:
+                    await asyncio.wait_for(sub.ready.wait(), EVENT_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    yield HEARTBEAT
+                    continue
+                yield sub.take()
+        finally:
+            self.subscribers.discard(sub)
+
+    def stats(self):
+        return {
+            "subscribers": len(self.subscribers),
+            "published": self.published,
+            "coalesced": self.coalesced,
+            "overflows": self.overflows,
+        }
+
+
+broker = Broker()
+
+
+class StreamingGZipMiddleware(GZipMiddleware):
+    """GZip that skips `exclude` paths: streamed chunks would sit in the gzip buffer"""
+
+    def __init__(self, app, exclude=("/events",), **options):
+        super().__init__(app, **options)
+        self.exclude = exclude
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"].startswith(self.exclude):
+            await self.app(scope, receive, send)
+        else:
+            await super().__call__(scope, receive, send)
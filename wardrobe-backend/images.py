@@ -0,0 +1,154 @@
+"""
+Content-addressed image storage with WebP thumbnails
+
+An upload is stored once under the SHA-256 of its bytes, so re-uploading
+the same photo (or using it for several items) costs no disk or CPU. Each
+original gets WebP variants at THUMBNAIL_WIDTHS, named `<digest>-<width>.webp`,
+rendered by Pillow in a small process pool so resizing never blocks the
+event loop. Since a name always refers to the same bytes, files are served
+as immutable.
+"""
+import asyncio
+import hashlib
+import multiprocessing
+import os
+import re
+import uuid
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+IMAGE_DIR = os.getenv("IMAGE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "images"))
+MAX_IMAGE_BYTES = int(os.getenv("MAX_IMAGE_BYTES", str(10 * 1024 * 1024)))
+THUMBNAIL_WIDTHS = tuple(int(w) for w in os.getenv("THUMBNAIL_WIDTHS", "320,640").split(","))
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "2"))
+
+IMAGE_TYPES = {"image/jpeg": "jpg", "image/png": "png", "image/webp": "webp", "image/gif": "gif"}
+MEDIA_TYPES = {ext: media_type for media_type, ext in IMAGE_TYPES.items()}
+
+# Only names this module generates; also keeps paths inside IMAGE_DIR
+NAME_PATTERN = re.compile(r"^([0-9a-f]{64})(?:-(\d+))?\.(jpg|png|webp|gif)$")
+
+_pool = None
+
+
+class InvalidImage(ValueError):
+    pass
+
+
+class ImageTooLarge(InvalidImage):
+    """More pixels than Pillow's MAX_IMAGE_PIXELS: a small file can decode to gigabytes"""
+
+
+def image_path(name):
+    """Path of a stored image, or None if `name` is not one of ours"""
+    if not NAME_PATTERN.match(name):
+        return None
+    return os.path.join(IMAGE_DIR, name[:2], name)
+
+
+def variant_name(digest, width):
+    return f"{digest}-{width}.webp"
+
+
+def _write_atomic(path, write):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+    try:
+        write(tmp)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def make_variants(source, digest, widths):
+    """Runs in a pool worker: check the upload decodes and write its WebP variants"""
+    from PIL import Image, UnidentifiedImageError
+
+    try:
+        # Pillow only warns between MAX_IMAGE_PIXELS and twice that; refuse those too
+        with warnings.catch_warnings():
+            warnings.simplefilter("error", Image.DecompressionBombWarning)
+            with Image.open(source) as image:
+                image.load()
+                if image.mode not in ("RGB", "RGBA"):
+                    image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+                for width in widths:
+                    path = image_path(variant_name(digest, width))
+                    if os.path.exists(path):
+                        continue
+                    resized = image.copy()
+                    # Fits the width, keeps the aspect ratio and never upscales
+                    resized.thumbnail((width, image.height))
+                    _write_atomic(path, lambda tmp: resized.save(tmp, "WEBP", quality=80, method=4))
+    except (Image.DecompressionBombError, Image.DecompressionBombWarning) as exc:
+        raise ImageTooLarge(str(exc)) from None
+    except (UnidentifiedImageError, OSError) as exc:
+        raise InvalidImage(str(exc)) from None
+
+
+def pool():
+    global _pool
+    if _pool is None:
+        # Spawned, not forked: the API process has driver threads a fork would copy
+        _pool = ProcessPoolExecutor(IMAGE_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+async def store_image(body, content_type):
+    """Store an upload and its variants; returns (original name, {width: variant name})"""
+    ext = IMAGE_TYPES[content_type]
+    digest = hashlib.sha256(body).hexdigest()
+    name = f"{digest}.{ext}"
+    path = image_path(name)
+    variants = {width: variant_name(digest, width) for width in THUMBNAIL_WIDTHS}
+
+    if os.path.exists(path) and all(os.path.exists(image_path(v)) for v in variants.values()):
+        return name, variants
+
+    def write_original(tmp):
+        with open(tmp, "wb") as f:
+            f.write(body)
+
+    # Decode and resize from a scratch copy so a file that isn't really an
+    # image never lands under its digest
+    scratch = f"{path}.{uuid.uuid4().hex}.upload"
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    try:
+        await asyncio.to_thread(write_original, scratch)
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(pool(), make_variants, scratch, digest, THUMBNAIL_WIDTHS)
+        os.replace(scratch, path)
+    finally:
+        if os.path.exists(scratch):
+            os.remove(scratch)
+    return name, variants
+
+
+def byte_range(header, size):
+    """Parse a single `bytes=start-end` Range header; None to send the whole file"""
+    match = re.fullmatch(r"bytes=(\d*)-(\d*)", (header or "").strip())
+    if not match or match.groups() == ("", ""):
+        return None
+    start, end = match.groups()
+    if start == "":
+        # Suffix range: the last N bytes
+        start, end = max(size - int(end), 0), size - 1
+    else:
+        start, end = int(start), min(int(end) if end else size - 1, size - 1)
+    if start > end or start >= size:
+        raise ValueError("Range not satisfiable")
+    return start, end
+
+
+def read_range(path, start, end):
+    with open(path, "rb") as f:
+        f.seek(start)
+        return f.read(end - start + 1)
@@ -0,0 +1,83 @@
+"""
+Background jobs that run inside the API process
+"""
+import asyncio
+import logging
+import os
+from datetime import date
+
+from sqlalchemy import insert, update
+
+from changes import touch
+from database import AsyncSessionLocal, run_with_retry
+from models import Log, Rental
+from recommendations import RECOMMENDATION_REFRESH_INTERVAL, recommender
+
+logger = logging.getLogger("wardrobe.jobs")
+
+# Seconds between overdue sweeps; 0 disables the sweeper
+OVERDUE_SWEEP_INTERVAL = int(os.getenv("OVERDUE_SWEEP_INTERVAL", "3600"))
+
+
+async def periodic(interval, job):
+    """Run job() now and then every `interval` seconds until cancelled"""
+    while True:
+        try:
+            await job()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Background job %s failed", job.__name__)
+        await asyncio.sleep(interval)
+
+
+async def sweep_overdue_rentals():
+    """Mark checked-out rentals past their due date as overdue and log each one"""
+    async with AsyncSessionLocal() as session:
+
+        async def apply():
+            # Range scan on ix_rentals_status_due touches only newly overdue
+            # rows; RETURNING hands them back for the log without a re-read
+            result = await session.execute(
+                update(Rental)
+                .where(Rental.status == "checked_out", Rental.expected_return_date < date.today())
+                .values(status="overdue")
+                .returning(Rental.item_id, Rental.member_id)
+                .execution_options(synchronize_session=False)
+            )
+            rows = result.all()
+            if not rows:
+                # Nothing changed; rolling back keeps the no-op from bumping
+                # table versions and invalidating caches
+                await session.rollback()
+                return 0
+            touch(session, "rentals", *(item_id for item_id, _ in rows))
+            await session.execute(
+                insert(Log),
+                [{"item_id": item_id, "user_id": member_id, "action": "overdue"} for item_id, member_id in rows],
+            )
+            await session.commit()
+            return len(rows)
+
+        marked = await run_with_retry(session, apply)
+        if marked:
+            logger.info("Marked %d rentals overdue", marked)
+        return marked
+
+
+def start_jobs():
+    """Start the enabled background jobs; returns their tasks for shutdown"""
+    tasks = []
+    if OVERDUE_SWEEP_INTERVAL > 0:
+        tasks.append(asyncio.create_task(periodic(OVERDUE_SWEEP_INTERVAL, sweep_overdue_rentals)))
+    if RECOMMENDATION_REFRESH_INTERVAL > 0:
+        tasks.append(asyncio.create_task(periodic(RECOMMENDATION_REFRESH_INTERVAL, recommender.refresh)))
+    else:
+        tasks.append(asyncio.create_task(recommender.refresh()))
+    return tasks
+
+
+async def stop_jobs(tasks):
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
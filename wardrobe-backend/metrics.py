@@ -0,0 +1,191 @@
+"""
+Per-request latency and SQL instrumentation, rendered in Prometheus text format
+
+`MetricsMiddleware` times every request and opens a per-request stats
+record in a context variable; SQLAlchemy cursor events attached with
+`instrument_engine` add each statement's count and duration to it. Totals
+are aggregated per route template (e.g. /items/{item_id}), and statements
+slower than SLOW_QUERY_MS are kept as samples with their SQL.
+"""
+import os
+import time
+from collections import defaultdict, deque
+from contextvars import ContextVar
+
+from sqlalchemy import event
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "100"))
+SLOW_QUERY_SAMPLES = int(os.getenv("SLOW_QUERY_SAMPLES", "20"))
+SERVER_TIMING = os.getenv("SERVER_TIMING", "false").lower() == "true"
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_current = ContextVar("request_stats", default=None)
+
+
+class RequestStats:
+    __slots__ = ("route", "statements", "db_time")
+
+    def __init__(self):
+        self.route = None
+        self.statements = 0
+        self.db_time = 0.0
+
+
+class Histogram:
+    __slots__ = ("counts", "total", "count")
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.total += value
+        self.count += 1
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+
+class Registry:
+    def __init__(self):
+        self.latency = defaultdict(Histogram)  # (method, route) -> Histogram
+        self.responses = defaultdict(int)  # (method, route, status) -> count
+        self.statements = defaultdict(int)  # (method, route) -> count
+        self.db_time = defaultdict(float)  # (method, route) -> seconds
+        self.slow_queries = deque(maxlen=SLOW_QUERY_SAMPLES)
+
+    def record(self, method, route, status, elapsed, stats):
+        key = (method, route)
+        self.latency[key].observe(elapsed)
+        self.responses[(method, route, status)] += 1
+        self.statements[key] += stats.statements
+        self.db_time[key] += stats.db_time
+
+    def render(self):
+        lines = [
+            "# HELP wardrobe_http_request_duration_seconds Request latency by route",
+            "# TYPE wardrobe_http_request_duration_seconds histogram",
+        ]
+        for (method, route), hist in sorted(self.latency.items()):
+            labels = f'method="{method}",route="{_escape(route)}"'
+            cumulative = 0
+            for bound, count in zip(BUCKETS, hist.counts):
+                cumulative += count
+                lines.append(f'wardrobe_http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'wardrobe_http_request_duration_seconds_bucket{{{labels},le="+Inf"}} {hist.count}')
+            lines.append(f"wardrobe_http_request_duration_seconds_sum{{{labels}}} {hist.total:.6f}")
+            lines.append(f"wardrobe_http_request_duration_seconds_count{{{labels}}} {hist.count}")
+
+        lines += [
+            "# HELP wardrobe_http_responses_total Responses by route and status code",
+            "# TYPE wardrobe_http_responses_total counter",
+        ]
+        for (method, route, status), count in sorted(self.responses.items()):
+            lines.append(
+                f'wardrobe_http_responses_total{{method="{method}",route="{_escape(route)}",status="{status}"}} {count}'
+            )
+
+        lines += [
+            "# HELP wardrobe_db_statements_total SQL statements executed by route",
+            "# TYPE wardrobe_db_statements_total counter",
+        ]
+        for (method, route), count in sorted(self.statements.items()):
+            lines.append(f'wardrobe_db_statements_total{{method="{method}",route="{_escape(route)}"}} {count}')
+
+        lines += [
+            "# HELP wardrobe_db_time_seconds_total Time spent executing SQL by route",
+            "# TYPE wardrobe_db_time_seconds_total counter",
+        ]
+        for (method, route), seconds in sorted(self.db_time.items()):
+            lines.append(f'wardrobe_db_time_seconds_total{{method="{method}",route="{_escape(route)}"}} {seconds:.6f}')
+
+        lines += [
+            f"# HELP wardrobe_db_slow_query_seconds Most recent statements slower than {SLOW_QUERY_MS:g} ms",
+            "# TYPE wardrobe_db_slow_query_seconds gauge",
+        ]
+        for sample in self.slow_queries:
+            route = sample["stats"].route if sample["stats"] else None
+            lines.append(
+                f'wardrobe_db_slow_query_seconds{{route="{_escape(route or "-")}",'
+                f'sql="{_escape(sample["sql"])}"}} {sample["seconds"]:.6f}'
+            )
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", " ").replace('"', '\\"')
+
+
+registry = Registry()
+
+
+def instrument_engine(engine):
+    """Attribute each statement on a (sync) engine to the current request"""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        stats = _current.get()
+        if stats is not None:
+            stats.statements += 1
+            stats.db_time += elapsed
+        if elapsed * 1000 >= SLOW_QUERY_MS:
+            # The route is resolved once the request finishes, so keep its stats
+            registry.slow_queries.append({
+                "stats": stats,
+                "sql": " ".join(statement.split())[:500],
+                "seconds": elapsed,
+            })
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency, status and SQL totals per route"""
+
+    def __init__(self, app):
+        self.app = app
+        self._routes = None
+
+    def route_template(self, scope):
+        """Map the matched endpoint back to its path template to bound cardinality"""
+        if self._routes is None:
+            self._routes = {
+                getattr(route, "endpoint", None): route.path
+                for route in scope["app"].routes
+            }
+        return self._routes.get(scope.get("endpoint"), "unmatched")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        stats = RequestStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if SERVER_TIMING:
+                    app_ms = (time.perf_counter() - started) * 1000
+                    timing = (
+                        f'db;dur={stats.db_time * 1000:.1f};desc="{stats.statements} queries", '
+                        f"app;dur={app_ms:.1f}"
+                    )
+                    message["headers"] = [*message.get("headers", []), (b"server-timing", timing.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            stats.route = self.route_template(scope)
+            registry.record(scope["method"], stats.route, status, time.perf_counter() - started, stats)
+            _current.reset(token)
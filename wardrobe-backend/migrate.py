@@ -0,0 +1,281 @@
+"""
+Versioned schema migrations, and the command that applies them
+
+The database records which migrations it has had in a `schema_version`
+table, one row each. `python migrate.py` applies the pending ones in
+order; the API only checks the version at startup (check_schema()) and
+refuses to run against a database that is behind.
+
+Migrations are written to run while the API keeps serving:
+
+  - indexes are built with IF NOT EXISTS, and CONCURRENTLY on PostgreSQL
+    (SQLite has no online build; it holds the write lock while the index
+    is built, readers carry on under WAL)
+  - new columns are added nullable, which is a metadata-only change, and
+    derived values are backfilled in primary-key ranges of --chunk-size
+    rows, each its own short transaction, pausing in between so waiting
+    API writes get the lock
+
+The baseline creates whatever tables are missing straight from models.py,
+so on a fresh database it already builds the latest schema; every later
+migration checks before it changes anything and is a no-op there. That
+also makes a migration that failed halfway safe to run again.
+
+Usage:
+    python migrate.py                      # apply pending migrations
+    python migrate.py status
+    python migrate.py rebuild-rollups      # recompute rental_stats_daily
+    python migrate.py --url sqlite:///bench.db --chunk-size 5000
+"""
+import argparse
+import os
+import time
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, func, inspect, insert, select, text
+
+from analytics import REBUILD_OPEN, rebuild_statements
+from database import DATABASE_URL, make_engine
+from models import Base, RentalStatsDaily, RentalStatsOpen
+from search import setup_search
+
+MIGRATION_CHUNK_SIZE = int(os.getenv("MIGRATION_CHUNK_SIZE", "2000"))
+MIGRATION_PAUSE = float(os.getenv("MIGRATION_PAUSE", "0.05"))
+
+# Kept out of Base.metadata: it describes the database, not the domain
+schema_version = Table(
+    "schema_version",
+    MetaData(),
+    Column("version", Integer, primary_key=True),
+    Column("name", String, nullable=False),
+    Column("applied_at", DateTime, server_default=func.now()),
+)
+
+MIGRATIONS = []
+
+
+class SchemaOutdated(RuntimeError):
+    pass
+
+
+def migration(version, name):
+    """Register `apply(engine, chunk_size, pause)` as migration `version`"""
+    def register(apply):
+        MIGRATIONS.append((version, name, apply))
+        return apply
+    return register
+
+
+# ---------- Helpers for online changes ----------
+
+def model_index(table, name):
+    return next(index for index in Base.metadata.tables[table].indexes if index.name == name)
+
+
+def create_index(engine, index):
+    """Build one of the models' indexes if it is missing"""
+    columns = ", ".join(column.name for column in index.columns)
+    concurrently = "CONCURRENTLY " if engine.dialect.name == "postgresql" else ""
+    # CONCURRENTLY cannot run inside a transaction block
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text(
+            f"CREATE INDEX {concurrently}IF NOT EXISTS {index.name} ON {index.table.name} ({columns})"
+        ))
+
+
+def add_column(engine, table, ddl):
+    """ALTER TABLE ... ADD COLUMN unless the column (the first word of `ddl`) exists"""
+    name = ddl.split()[0]
+    if name not in {column["name"] for column in inspect(engine).get_columns(table)}:
+        with engine.begin() as conn:
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {ddl}"))
+
+
+def backfill(engine, table, key, statement, chunk_size, pause):
+    """Run `statement` for :low..:high key ranges, one commit per chunk; returns rows changed"""
+    with engine.connect() as conn:
+        low, high = conn.execute(text(f"SELECT min({key}), max({key}) FROM {table}")).one()
+    changed = 0
+    if low is None:
+        return changed
+    for start in range(low, high + 1, chunk_size):
+        with engine.begin() as conn:
+            changed += conn.execute(text(statement), {"low": start, "high": start + chunk_size - 1}).rowcount
+        time.sleep(pause)
+    return changed
+
+
+# Rentals' item values from checkout, for rentals written without them
+RENTAL_ITEM_VALUES = """
+    UPDATE rentals SET
+        item_category = coalesce(items.category, ''),
+        item_size = coalesce(items.size, ''),
+        item_brand = coalesce(items.brand, '')
+    FROM items
+    WHERE items.item_id = rentals.item_id
+      AND rentals.rental_id BETWEEN :low AND :high AND rentals.item_category IS NULL
+"""
+
+
+def rebuild_rollups(engine, chunk_size=MIGRATION_CHUNK_SIZE, pause=MIGRATION_PAUSE):
+    """Recompute rental_stats_daily and rental_stats_open from the rental history; returns rollup rows written"""
+    # Rentals loaded without their item values (seed data, older API
+    # processes) get their item's current ones, which later returns use too
+    backfill(engine, "rentals", "rental_id", RENTAL_ITEM_VALUES, chunk_size, pause)
+    # Starting from empty makes a rerun safe; the chunks add to what earlier
+    # ones wrote. Run it while no API writes rentals: a checkout or return
+    # the API records into a chunk that hasn't been read yet counts twice
+    with engine.begin() as conn:
+        conn.execute(RentalStatsDaily.__table__.delete())
+    written = sum(
+        backfill(engine, "rentals", "rental_id", statement, chunk_size, pause)
+        for statement in rebuild_statements(engine.dialect.name)
+    )
+    with engine.begin() as conn:
+        conn.execute(RentalStatsOpen.__table__.delete())
+        conn.execute(text(REBUILD_OPEN))
+    return written
+
+
+# ---------- Migrations ----------
+
+@migration(1, "baseline tables")
+def baseline(engine, chunk_size, pause):
+    # What the API used to run at import; on an existing database it only
+    # adds tables that are missing entirely
+    Base.metadata.create_all(engine)
+
+
+@migration(2, "indexes for requests, rentals and logs")
+def lookup_indexes(engine, chunk_size, pause):
+    for table, name in [
+        ("requests", "ix_requests_member_item"),
+        ("rentals", "ix_rentals_item_status"),
+        ("rentals", "ix_rentals_status_due"),
+        ("logs", "ix_logs_item_time"),
+    ]:
+        create_index(engine, model_index(table, name))
+
+
+@migration(3, "full-text search index")
+def search_index(engine, chunk_size, pause):
+    setup_search(engine)
+
+
+@migration(4, "rentals.request_id")
+def rental_request(engine, chunk_size, pause):
+    add_column(engine, "rentals", "request_id INTEGER REFERENCES requests(request_id)")
+    # Link existing rentals to the approved request that produced them: same
+    # item and member, checked out on the request's start date. Only rows
+    # with a match are written (UPDATE ... FROM needs SQLite 3.33+)
+    backfill(engine, "rentals", "rental_id", """
+        UPDATE rentals SET request_id = matched.request_id
+        FROM (
+            SELECT rentals.rental_id, max(requests.request_id) AS request_id
+            FROM rentals JOIN requests
+              ON requests.member_id = rentals.member_id
+             AND requests.item_id = rentals.item_id
+             AND requests.start_date = rentals.checkout_date
+             AND requests.status = 'approved'
+            WHERE rentals.rental_id BETWEEN :low AND :high AND rentals.request_id IS NULL
+            GROUP BY rentals.rental_id
+        ) AS matched
+        WHERE rentals.rental_id = matched.rental_id
+    """, chunk_size, pause)
+    create_index(engine, model_index("rentals", "ix_rentals_request"))
+
+
+@migration(5, "rentals.member_id index")
+def rental_member_index(engine, chunk_size, pause):
+    create_index(engine, model_index("rentals", "ix_rentals_member"))
+
+
+@migration(6, "daily rental rollups")
+def rental_rollups(engine, chunk_size, pause):
+    RentalStatsDaily.__table__.create(engine, checkfirst=True)
+    # Built here so rebuild_rollups() finds them; migration 7 is then a no-op
+    for column in ("item_category VARCHAR", "item_size VARCHAR", "item_brand VARCHAR"):
+        add_column(engine, "rentals", column)
+    RentalStatsOpen.__table__.create(engine, checkfirst=True)
+    # Rentals checked out or returned by API processes still running the
+    # previous version while this runs aren't counted; run
+    # `python migrate.py rebuild-rollups` once they are replaced
+    rebuild_rollups(engine, chunk_size, pause)
+
+
+@migration(7, "rental item values and open rental counts")
+def rental_item_values(engine, chunk_size, pause):
+    for column in ("item_category VARCHAR", "item_size VARCHAR", "item_brand VARCHAR"):
+        add_column(engine, "rentals", column)
+    backfill(engine, "rentals", "rental_id", RENTAL_ITEM_VALUES, chunk_size, pause)
+    if not inspect(engine).has_table("rental_stats_open"):
+        RentalStatsOpen.__table__.create(engine)
+        with engine.begin() as conn:
+            conn.execute(text(REBUILD_OPEN))
+
+
+LATEST = max(version for version, _, _ in MIGRATIONS)
+
+
+# ---------- Applying and checking ----------
+
+def current_version(engine):
+    """Highest applied migration; 0 for a database that predates migrations"""
+    if not inspect(engine).has_table("schema_version"):
+        return 0
+    with engine.connect() as conn:
+        return conn.scalar(select(func.max(schema_version.c.version))) or 0
+
+
+def check_schema(engine):
+    """Raise SchemaOutdated unless every migration this code knows has been applied"""
+    current = current_version(engine)
+    if current < LATEST:
+        raise SchemaOutdated(
+            f"Database schema is at version {current}, this code needs {LATEST}; run `python migrate.py`"
+        )
+
+
+def upgrade(engine, chunk_size=MIGRATION_CHUNK_SIZE, pause=MIGRATION_PAUSE, log=print):
+    """Apply pending migrations in order; returns the resulting version"""
+    schema_version.create(engine, checkfirst=True)
+    current = current_version(engine)
+    for version, name, apply in sorted(MIGRATIONS):
+        if version <= current:
+            continue
+        log(f"Applying {version}: {name}...")
+        started = time.perf_counter()
+        apply(engine, chunk_size, pause)
+        with engine.begin() as conn:
+            conn.execute(insert(schema_version).values(version=version, name=name))
+        log(f"  done in {time.perf_counter() - started:.1f}s")
+        current = version
+    return current
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", nargs="?", choices=["upgrade", "status", "rebuild-rollups"], default="upgrade")
+    parser.add_argument("--url", default=DATABASE_URL, help="database URL (default: DATABASE_URL)")
+    parser.add_argument("--chunk-size", type=int, default=MIGRATION_CHUNK_SIZE, help="rows per backfill transaction")
+    parser.add_argument("--pause", type=float, default=MIGRATION_PAUSE, help="seconds to sleep between chunks")
+    args = parser.parse_args()
+
+    engine = make_engine(args.url)
+    try:
+        if args.command == "status":
+            current = current_version(engine)
+            for version, name, _ in sorted(MIGRATIONS):
+                print(f"{version:>4}  {'applied' if version <= current else 'pending':<8} {name}")
+        elif args.command == "rebuild-rollups":
+            check_schema(engine)
+            rows = rebuild_rollups(engine, args.chunk_size, args.pause)
+            print(f"✅ Rebuilt rental rollups ({rows} rows written)")
+        else:
+            version = upgrade(engine, args.chunk_size, args.pause)
+            print(f"✅ Database schema at version {version}")
+    finally:
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
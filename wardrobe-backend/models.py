@@ -1,6 +1,6 @@
 from sqlalchemy import (
     create_engine, Column, Integer, String, Date, DateTime,
-    ForeignKey, Enum, func
+    ForeignKey, Enum, Index, func
 )
 from sqlalchemy.orm import declarative_base, relationship, sessionmaker
 
@@ -63,11 +63,19 @@ class Request(Base):
     member = relationship("Member", back_populates="requests")
     item = relationship("Item", back_populates="requests")
 
+    __table_args__ = (
+        Index("ix_requests_member_item", "member_id", "item_id"),
+    )
+
     def __repr__(self):
         return f"<Request(item={self.item_id}, member={self.member_id}, status='{self.status}')>"
 
 
 # ---------- Rentals ----------
+# Rentals whose item has not come back yet
+OPEN_RENTAL_STATUSES = ("checked_out", "overdue")
+
+
 class Rental(Base):
     __tablename__ = "rentals"
 
@@ -78,11 +86,26 @@ class Rental(Base):
     expected_return_date = Column(Date)
     actual_return_date = Column(Date)
     status = Column(Enum("checked_out", "returned", "overdue", name="rental_status"), default="checked_out")
+    # The approved request this checkout fulfils, if it came from one
+    request_id = Column(Integer, ForeignKey("requests.request_id"))
+    # The item's category, size and brand at checkout ("" for none), which
+    # the analytics rollups file both the checkout and the return under
+    item_category = Column(String)
+    item_size = Column(String)
+    item_brand = Column(String)
 
     # Relationships
     item = relationship("Item", back_populates="rentals")
     member = relationship("Member", back_populates="rentals")
 
+    __table_args__ = (
+        Index("ix_rentals_item_status", "item_id", "status"),
+        Index("ix_rentals_status_due", "status", "expected_return_date"),
+        Index("ix_rentals_request", "request_id"),
+        # Foreign keys aren't indexed automatically (PostgreSQL included)
+        Index("ix_rentals_member", "member_id"),
+    )
+
     def __repr__(self):
         return f"<Rental(item={self.item_id}, member={self.member_id}, status='{self.status}')>"
 
@@ -101,5 +124,41 @@ class Log(Base):
     item = relationship("Item", back_populates="logs")
     user = relationship("Member", back_populates="logs")
 
+    __table_args__ = (
+        Index("ix_logs_item_time", "item_id", "timestamp"),
+    )
+
     def __repr__(self):
         return f"<Log(item={self.item_id}, action='{self.action}', time={self.timestamp})>"
+
+
+# ---------- Rollups ----------
+class RentalStatsDaily(Base):
+    """Rental counters per day for each category, size and brand value (see analytics.py)"""
+    __tablename__ = "rental_stats_daily"
+
+    dimension = Column(String, primary_key=True)  # "category", "size" or "brand"
+    day = Column(Date, primary_key=True)
+    value = Column(String, primary_key=True)      # "" for items without one
+    checkouts = Column(Integer, nullable=False, default=0, server_default="0")
+    returns = Column(Integer, nullable=False, default=0, server_default="0")
+    rental_days = Column(Integer, nullable=False, default=0, server_default="0")   # checkout to return, summed over returns
+    late_returns = Column(Integer, nullable=False, default=0, server_default="0")
+    late_days = Column(Integer, nullable=False, default=0, server_default="0")     # days past the expected return date
+    lead_count = Column(Integer, nullable=False, default=0, server_default="0")    # checkouts that came from a request
+    lead_days = Column(Integer, nullable=False, default=0, server_default="0")     # request date to checkout, summed
+
+    def __repr__(self):
+        return f"<RentalStatsDaily({self.dimension}={self.value!r}, day={self.day})>"
+
+
+class RentalStatsOpen(Base):
+    """Checkouts minus returns per category, size and brand value, summed over every rollup day"""
+    __tablename__ = "rental_stats_open"
+
+    dimension = Column(String, primary_key=True)
+    value = Column(String, primary_key=True)
+    outstanding = Column(Integer, nullable=False, default=0, server_default="0")
+
+    def __repr__(self):
+        return f"<RentalStatsOpen({self.dimension}={self.value!r}, outstanding={self.outstanding})>"
@@ -0,0 +1,153 @@
+"""
+Item recommendations from an item-item co-rental similarity matrix
+
+The model is built offline, at startup and then every
+RECOMMENDATION_REFRESH_INTERVAL seconds, from the distinct (member, item)
+pairs in `rentals`. With M the binary member x item matrix, two items are
+as similar as the cosine of their columns in M: how often the same members
+rented both, relative to how often each was rented. Each item keeps only
+its RECOMMENDATION_NEIGHBORS most similar items, and each member's best
+RECOMMENDATION_COUNT items they haven't rented (their rented items'
+similarities, summed) are ranked at build time too, so a request is a
+dict lookup. Members with no rentals (or too few co-renters) get the most
+rented items they haven't had.
+
+The matrix products run in row chunks, so memory stays bounded by the
+chunk size rather than the (items x items) co-rental counts.
+"""
+import asyncio
+import logging
+import os
+import time
+
+import numpy as np
+from scipy import sparse
+from sqlalchemy import select
+
+from database import ReadSessionLocal
+from models import Rental
+
+logger = logging.getLogger("wardrobe.recommendations")
+
+# Seconds between rebuilds; 0 builds once at startup
+RECOMMENDATION_REFRESH_INTERVAL = int(os.getenv("RECOMMENDATION_REFRESH_INTERVAL", "3600"))
+RECOMMENDATION_NEIGHBORS = int(os.getenv("RECOMMENDATION_NEIGHBORS", "50"))
+RECOMMENDATION_COUNT = int(os.getenv("RECOMMENDATION_COUNT", "50"))
+
+CHUNK_ROWS = 2000
+
+
+def top_k(rows, k):
+    """Column indexes and values of the k largest entries in each CSR row, best first"""
+    rows.eliminate_zeros()
+    result = []
+    for row in range(rows.shape[0]):
+        start, end = rows.indptr[row], rows.indptr[row + 1]
+        columns, values = rows.indices[start:end], rows.data[start:end]
+        if len(values) > k:
+            best = np.argpartition(-values, k)[:k]
+            columns, values = columns[best], values[best]
+        order = np.argsort(-values, kind="stable")
+        result.append((columns[order], values[order]))
+    return result
+
+
+def build(member_ids, item_ids, neighbors=RECOMMENDATION_NEIGHBORS, count=RECOMMENDATION_COUNT):
+    """Per-member recommendations and a popularity fallback from (member, item) pairs"""
+    members, member_index = np.unique(member_ids, return_inverse=True)
+    items, item_index = np.unique(item_ids, return_inverse=True)
+    rented = sparse.csr_matrix(
+        (np.ones(len(member_index), dtype=np.float32), (member_index, item_index)),
+        shape=(len(members), len(items)),
+    )
+    rented.data[:] = 1  # a member renting an item twice still counts once
+    by_item = rented.T.tocsr()
+    popularity = np.asarray(rented.sum(axis=0)).ravel()
+    inverse_norm = 1 / np.sqrt(popularity)
+
+    # Similarity, item rows at a time: cosine of co-rental counts, keeping
+    # each item's `neighbors` best and never the item itself
+    similar_rows = []
+    for start in range(0, len(items), CHUNK_ROWS):
+        chunk = (by_item[start:start + CHUNK_ROWS] @ rented).tocsr()
+        chunk = (sparse.diags(inverse_norm[start:start + CHUNK_ROWS]) @ chunk @ sparse.diags(inverse_norm)).tocsr()
+        chunk.setdiag(0, k=start)
+        similar_rows.extend(top_k(chunk, neighbors))
+    similarity = sparse.csr_matrix(
+        (
+            np.concatenate([values for _, values in similar_rows]),
+            np.concatenate([columns for columns, _ in similar_rows]),
+            np.cumsum([0] + [len(columns) for columns, _ in similar_rows]),
+        ),
+        shape=(len(items), len(items)),
+    )
+
+    by_popularity = np.argsort(-popularity, kind="stable")
+
+    # Scores for every member, member rows at a time, minus what they've
+    # rented; short lists are topped up with popular items
+    by_member = {}
+    for start in range(0, len(members), CHUNK_ROWS):
+        history = rented[start:start + CHUNK_ROWS]
+        scores = (history @ similarity).tocsr()
+        scores = scores - scores.multiply(history)
+        for offset, (columns, _) in enumerate(top_k(scores.tocsr(), count)):
+            if len(columns) < count:
+                row = history.getrow(offset)
+                skip = set(columns.tolist()) | set(row.indices.tolist())
+                extra = [c for c in by_popularity[:count + len(skip)] if c not in skip]
+                columns = np.concatenate([columns, extra[:count - len(columns)]]).astype(np.int64)
+            by_member[int(members[start + offset])] = items[columns].tolist()
+
+    popular = items[by_popularity[:count]].tolist()
+    return by_member, popular, similarity.nnz
+
+
+class Recommender:
+    def __init__(self):
+        self.by_member = {}
+        self.popular = []
+        self.ready = False
+        self.built_at = None
+        self.build_seconds = None
+        self.pairs = 0
+        self.similarities = 0
+
+    def for_member(self, member_id):
+        """Ranked item ids for a member; the popular items if they have no history"""
+        return self.by_member.get(member_id) or self.popular
+
+    async def refresh(self):
+        """Reload rental pairs and rebuild the model off the event loop"""
+        started = time.perf_counter()
+        async with ReadSessionLocal() as session:
+            rows = (await session.execute(
+                select(Rental.member_id, Rental.item_id)
+                .where(Rental.member_id.is_not(None), Rental.item_id.is_not(None))
+                .distinct()
+            )).all()
+        member_ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+        item_ids = np.fromiter((row[1] for row in rows), dtype=np.int64, count=len(rows))
+        if len(rows):
+            by_member, popular, similarities = await asyncio.to_thread(build, member_ids, item_ids)
+        else:
+            by_member, popular, similarities = {}, [], 0
+        # Swap in the new model in one step; readers never see a partial build
+        self.by_member, self.popular = by_member, popular
+        self.pairs, self.similarities = len(rows), similarities
+        self.built_at = time.time()
+        self.build_seconds = round(time.perf_counter() - started, 3)
+        self.ready = True
+        logger.info("Built recommendations from %d pairs in %.1fs", len(rows), self.build_seconds)
+
+    def stats(self):
+        return {
+            "ready": self.ready,
+            "members": len(self.by_member),
+            "pairs": self.pairs,
+            "similarities": self.similarities,
+            "build_seconds": self.build_seconds,
+        }
+
+
+recommender = Recommender()
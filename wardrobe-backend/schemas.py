@@ -0,0 +1,201 @@
+"""
+Pydantic models for request bodies and response payloads
+
+Request bodies are validated before a route runs, so bad ids, dates or
+statuses come back as 422s instead of reaching the database. Response
+models document each payload; list routes with `fields=` return only the
+selected keys.
+"""
+from datetime import date, datetime
+from typing import List, Literal, Optional
+
+from pydantic import BaseModel, Field, field_validator
+
+ItemStatus = Literal["available", "rented", "repair", "retired"]
+RequestStatus = Literal["pending", "approved", "rejected"]
+MemberRole = Literal["borrower", "staff"]
+# Item columns the analytics rollups are kept for
+AnalyticsDimension = Literal["category", "size", "brand"]
+
+MAX_BATCH_SIZE = 500
+
+
+# ---------- Request bodies ----------
+
+class ItemCreate(BaseModel):
+    name: str
+    category: Optional[str] = None
+    size: Optional[str] = None
+    color: Optional[str] = None
+    brand: Optional[str] = None
+    status: ItemStatus = "available"
+    image_url: Optional[str] = None
+
+
+class ItemUpdate(BaseModel):
+    name: Optional[str] = None
+    category: Optional[str] = None
+    size: Optional[str] = None
+    color: Optional[str] = None
+    brand: Optional[str] = None
+    status: Optional[ItemStatus] = None
+    image_url: Optional[str] = None
+
+    # Leaving these out keeps the current value; an explicit null would clear
+    # a column that must have one
+    @field_validator("name", "status")
+    @classmethod
+    def not_null(cls, value):
+        if value is None:
+            raise ValueError("may be omitted but not null")
+        return value
+
+
+class RequestCreate(BaseModel):
+    item_id: int
+    # The frontend sends borrower_id; member_id is accepted as well
+    borrower_id: Optional[int] = None
+    member_id: Optional[int] = None
+    start_date: Optional[date] = None
+    end_date: Optional[date] = None
+    purpose: Optional[str] = None
+
+
+class RequestUpdate(BaseModel):
+    status: Optional[RequestStatus] = None
+    # Used for the rental when the request itself has no dates
+    checkout_date: Optional[date] = None
+    expected_return_date: Optional[date] = None
+
+
+class RequestBatch(BaseModel):
+    request_ids: List[int] = Field(min_length=1, max_length=MAX_BATCH_SIZE)
+
+
+class RentalCreate(BaseModel):
+    item_id: int
+    member_id: int
+    checkout_date: Optional[date] = None
+    expected_return_date: Optional[date] = None
+
+
+class RentalBatch(BaseModel):
+    rental_ids: List[int] = Field(min_length=1, max_length=MAX_BATCH_SIZE)
+
+
+class MemberCreate(BaseModel):
+    name: str
+    email: str
+    role: MemberRole = "borrower"
+
+
+# ---------- Responses ----------
+
+class ItemOut(BaseModel):
+    id: int
+    name: str
+    category: Optional[str] = None
+    size: Optional[str] = None
+    color: Optional[str] = None
+    brand: Optional[str] = None
+    status: Optional[str] = None
+    image_url: Optional[str] = None
+    rental_end_date: Optional[date] = None
+
+
+class RequestOut(BaseModel):
+    id: int
+    item_id: Optional[int] = None
+    item_name: Optional[str] = None
+    item_brand: Optional[str] = None
+    borrower_id: Optional[int] = None
+    borrower_name: Optional[str] = None
+    start_date: Optional[date] = None
+    end_date: Optional[date] = None
+    # "active" or "completed" once the request has become a rental
+    status: Optional[str] = None
+    purpose: Optional[str] = None
+    created_at: Optional[date] = None
+
+
+class RentalOut(BaseModel):
+    id: int
+    item_id: Optional[int] = None
+    item_name: Optional[str] = None
+    member_id: Optional[int] = None
+    member_name: Optional[str] = None
+    checkout_date: Optional[date] = None
+    expected_return_date: Optional[date] = None
+    actual_return_date: Optional[date] = None
+    status: Optional[str] = None
+
+
+class MemberOut(BaseModel):
+    id: int
+    name: str
+    email: str
+    role: Optional[str] = None
+
+
+class LogOut(BaseModel):
+    id: int
+    item_id: Optional[int] = None
+    user_id: Optional[int] = None
+    timestamp: Optional[datetime] = None
+    action: Optional[str] = None
+
+
+class BatchOutcome(BaseModel):
+    id: int
+    # "approved"/"returned" on success, otherwise "not_found" or "conflict"
+    outcome: str
+    rental_id: Optional[int] = None
+    detail: Optional[str] = None
+
+
+class Overview(BaseModel):
+    total_items: int
+    available_items: int
+    rented_items: int
+    pending_requests: int
+    active_rentals: int
+
+
+# ---------- Analytics ----------
+# One row per week (Monday) and value of the grouped column
+
+class UtilizationOut(BaseModel):
+    week: date
+    value: str
+    items: int
+    checkouts: int
+    returns: int
+    item_days: int
+    # item_days over items x days in the week; None when there are no items
+    utilization: Optional[float] = None
+
+
+class LeadTimeOut(BaseModel):
+    week: date
+    value: str
+    checkouts: int
+    from_requests: int
+    avg_lead_days: Optional[float] = None
+
+
+class ReturnLatenessOut(BaseModel):
+    week: date
+    value: str
+    returns: int
+    avg_rental_days: Optional[float] = None
+    late_returns: int
+    late_rate: float
+    avg_days_late: Optional[float] = None
+
+
+class ItemUtilizationOut(BaseModel):
+    week: date
+    checkouts: int
+    returns: int
+    item_days: int
+    utilization: float
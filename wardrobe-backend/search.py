@@ -0,0 +1,104 @@
+"""
+Full-text catalog search over items: an FTS5 index on SQLite, a GIN
+tsvector index on PostgreSQL
+"""
+import re
+
+from sqlalchemy import Float, Integer, text
+
+# External-content FTS5 table: the index stores only tokens and reads the
+# column values back from `items`, so it adds little to the database size.
+# prefix='2 3' keeps short prefix queries from the search box index-only.
+FTS_DDL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS items_fts USING fts5(
+        name, brand, color, category,
+        content='items', content_rowid='item_id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS items_fts_insert AFTER INSERT ON items BEGIN
+        INSERT INTO items_fts(rowid, name, brand, color, category)
+        VALUES (new.item_id, new.name, new.brand, new.color, new.category);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS items_fts_delete AFTER DELETE ON items BEGIN
+        INSERT INTO items_fts(items_fts, rowid, name, brand, color, category)
+        VALUES ('delete', old.item_id, old.name, old.brand, old.color, old.category);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS items_fts_update
+    AFTER UPDATE OF name, brand, color, category ON items BEGIN
+        INSERT INTO items_fts(items_fts, rowid, name, brand, color, category)
+        VALUES ('delete', old.item_id, old.name, old.brand, old.color, old.category);
+        INSERT INTO items_fts(rowid, name, brand, color, category)
+        VALUES (new.item_id, new.name, new.brand, new.color, new.category);
+    END
+    """,
+]
+
+# bm25 column weights, in FTS column order: name, brand, color, category
+RANK = "bm25(items_fts, 10.0, 5.0, 2.0, 2.0)"
+
+# PostgreSQL: the same columns weighted A > B > C. Queries must repeat this
+# exact expression for the planner to use the index built on it
+PG_DOCUMENT = (
+    "setweight(to_tsvector('simple', coalesce(name, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(brand, '')), 'B') || "
+    "setweight(to_tsvector('simple', coalesce(color, '') || ' ' || coalesce(category, '')), 'C')"
+)
+PG_DDL = f"CREATE INDEX IF NOT EXISTS ix_items_search ON items USING gin (({PG_DOCUMENT}))"
+
+
+def setup_search(engine):
+    """Create the FTS index and its sync triggers, backfilling on first run"""
+    if engine.dialect.name == "postgresql":
+        # An expression index is maintained by PostgreSQL itself
+        with engine.begin() as conn:
+            conn.execute(text(PG_DDL))
+        return
+    if engine.dialect.name != "sqlite":
+        return
+    with engine.begin() as conn:
+        exists = conn.execute(
+            text("SELECT 1 FROM sqlite_master WHERE name = 'items_fts'")
+        ).first()
+        for statement in FTS_DDL:
+            conn.execute(text(statement))
+        if not exists:
+            conn.execute(text("INSERT INTO items_fts(items_fts) VALUES ('rebuild')"))
+
+
+def match_expression(q, dialect="sqlite"):
+    """Turn free text into an FTS5 (or tsquery) query where every word is a prefix term"""
+    terms = re.findall(r"\w+", q)
+    if dialect == "postgresql":
+        return " & ".join(f"{term}:*" for term in terms)
+    return " ".join(f'"{term}"*' for term in terms)
+
+
+def ranked_matches(q, dialect="sqlite"):
+    """Subquery of (item_id, rank) for items matching q, best first by rank"""
+    if dialect == "postgresql":
+        # ts_rank is higher for better matches; negate it to sort like bm25
+        return (
+            text(
+                f"SELECT item_id, -ts_rank({PG_DOCUMENT}, query) AS rank "
+                f"FROM items, to_tsquery('simple', :match) AS query WHERE {PG_DOCUMENT} @@ query"
+            )
+            .bindparams(match=match_expression(q, dialect))
+            .columns(item_id=Integer, rank=Float)
+            .subquery("matches")
+        )
+    return (
+        text(
+            f"SELECT rowid AS item_id, {RANK} AS rank "
+            "FROM items_fts WHERE items_fts MATCH :match"
+        )
+        .bindparams(match=match_expression(q))
+        .columns(item_id=Integer, rank=Float)
+        .subquery("matches")
+    )
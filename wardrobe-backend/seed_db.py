@@ -1,17 +1,19 @@
 """
 Seed the database with sample data for Cornell Wardrobe
 """
-from models import Base, create_engine, sessionmaker
-from models import Item, Member, Request, Rental
+from database import make_engine
+from migrate import rebuild_rollups
+from models import Item, Log, Member, Request, Rental, sessionmaker
 from datetime import date, timedelta
 
-# Create engine and session
-engine = create_engine("sqlite:///wardrobe.db")
+# Create engine and session for DATABASE_URL (default: sqlite:///wardrobe.db)
+engine = make_engine()
 Session = sessionmaker(bind=engine)
 session = Session()
 
 # Clear existing data
 print("Clearing existing data...")
+session.query(Log).delete()
 session.query(Rental).delete()
 session.query(Request).delete()
 session.query(Item).delete()
@@ -28,8 +30,7 @@ members = [
     Member(name="Emily Staff", email="es_staff@cornell.edu", role="staff"),
     Member(name="Frank Admin", email="fa_admin@cornell.edu", role="staff"),
 ]
-for member in members:
-    session.add(member)
+session.add_all(members)
 session.commit()
 print(f"✅ Created {len(members)} members")
 
@@ -178,8 +179,7 @@ items = [
     ),
 ]
 
-for item in items:
-    session.add(item)
+session.add_all(items)
 session.commit()
 print(f"✅ Created {len(items)} items")
 
@@ -222,8 +222,7 @@ requests = [
     ),
 ]
 
-for req in requests:
-    session.add(req)
+session.add_all(requests)
 session.commit()
 print(f"✅ Created {len(requests)} requests")
 
@@ -250,11 +249,13 @@ rentals = [
     ),
 ]
 
-for rental in rentals:
-    session.add(rental)
+session.add_all(rentals)
 session.commit()
 print(f"✅ Created {len(rentals)} rentals")
 
+# Bring the analytics rollups in line with the rentals above
+rebuild_rollups(engine, pause=0)
+
 print("\n🎉 Database seeded successfully!")
 print(f"Total members: {session.query(Member).count()}")
 print(f"Total items: {session.query(Item).count()}")
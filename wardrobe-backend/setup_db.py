@@ -1,13 +1,11 @@
-from models import Base, create_engine, sessionmaker
+from database import make_engine
+from migrate import upgrade
 
-# Create a new SQLite database file (can switch to PostgreSQL later)
-engine = create_engine("sqlite:///wardrobe.db")
+# Create the database named by DATABASE_URL (default: the SQLite file
+# wardrobe.db), or bring an existing one up to the current schema version
+engine = make_engine()
 
-# Create all tables
-Base.metadata.create_all(engine)
-
-# Optional: create a session for testing
-Session = sessionmaker(bind=engine)
-session = Session()
+# Create all tables and apply pending migrations
+upgrade(engine)
 
 print("✅ Database and tables created successfully!")
@@ -9,7 +9,7 @@ import { Skeleton } from "@/components/ui/skeleton"
 import { RequestModal } from "@/components/request-modal"
 import { ArrowLeft, Calendar, Ruler, Palette, Tag } from "lucide-react"
 import Link from "next/link"
-import { fetchItem, type Item } from "@/lib/api"
+import { fetchItem, imageUrl, type Item } from "@/lib/api"
 
 export default function ItemDetailPage() {
   const params = useParams<{ id: string }>()
@@ -86,7 +86,7 @@ export default function ItemDetailPage() {
           {/* Image */}
           <div className="overflow-hidden rounded-lg bg-muted">
             <img
-              src={item.image_url || `/placeholder.svg?height=800&width=600&query=${encodeURIComponent(item.name)}`}
+              src={imageUrl(item.image_url) || `/placeholder.svg?height=800&width=600&query=${encodeURIComponent(item.name)}`}
               alt={item.name}
               className="h-full w-full object-cover"
             />
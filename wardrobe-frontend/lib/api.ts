@@ -74,16 +74,46 @@ export async function fetchItems(filters: ItemsFilter = {}): Promise<Item[]> {
   })
 
   const url = `${API_URL}/items${params.toString() ? `?${params.toString()}` : ""}`
-  const response = await fetch(url, { cache: "no-store" })
+  // Revalidate with the stored ETag instead of refetching the whole catalog
+  const response = await fetch(url, { cache: "no-cache" })
 
   return handleResponse<Item[]>(response)
 }
 
 export async function fetchItem(itemId: number | string): Promise<Item> {
-  const response = await fetch(`${API_URL}/items/${itemId}`, { cache: "no-store" })
+  const response = await fetch(`${API_URL}/items/${itemId}`, { cache: "no-cache" })
   return handleResponse<Item>(response)
 }
 
+// Images uploaded to the backend are stored as /images/<sha256>.<ext> with
+// WebP thumbnails beside them; anything else is used as-is
+const STORED_IMAGE = /\/images\/([0-9a-f]{64})\.\w+$/
+
+// The backend stores uploads as paths relative to itself, not to this app
+export function imageUrl(url: string | undefined): string | undefined {
+  return url?.startsWith("/images/") ? `${API_URL}${url}` : url
+}
+
+export function thumbnailUrl(url: string | undefined, width: 320 | 640 = 320): string | undefined {
+  return imageUrl(url?.replace(STORED_IMAGE, `/images/$1-${width}.webp`))
+}
+
+export type ItemStatusEvent = Pick<Item, "id" | "status">
+
+// Live item status changes from the backend's /events stream. `onStale` fires
+// when the stream can't say exactly what changed (bulk imports, or this tab
+// fell too far behind) and the caller should refetch. Returns an unsubscribe.
+export function subscribeToItemEvents(
+  onItem: (event: ItemStatusEvent) => void,
+  onStale: () => void,
+): () => void {
+  const source = new EventSource(`${API_URL}/events`)
+  source.addEventListener("item", (event) => onItem(JSON.parse((event as MessageEvent).data)))
+  source.addEventListener("catalog", onStale)
+  source.addEventListener("resync", onStale)
+  return () => source.close()
+}
+
 export async function createRequest(payload: {
   item_id: number
   borrower_id: number
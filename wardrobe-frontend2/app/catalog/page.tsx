@@ -7,7 +7,7 @@ import { ItemCard } from "@/components/item-card"
 import { Button } from "@/components/ui/button"
 import { Skeleton } from "@/components/ui/skeleton"
 import { SlidersHorizontal } from "lucide-react"
-import { fetchItems as fetchItemsFromApi, type Item } from "@/lib/api"
+import { fetchItems as fetchItemsFromApi, subscribeToItemEvents, type Item } from "@/lib/api"
 
 function CatalogContent() {
   const searchParams = useSearchParams()
@@ -45,6 +45,14 @@ function CatalogContent() {
     loadItems()
   }, [loadItems])
 
+  // Patch statuses in place as items are checked out or returned
+  useEffect(() => {
+    return subscribeToItemEvents(
+      ({ id, status }) => setItems((current) => current.map((item) => (item.id === id ? { ...item, status } : item))),
+      loadItems,
+    )
+  }, [loadItems])
+
   const handleFilterChange = (newFilters: typeof filters) => {
     setFilters(newFilters)
   }
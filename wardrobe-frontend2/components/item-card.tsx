@@ -2,7 +2,7 @@ import Link from "next/link"
 import { Card, CardContent, CardFooter } from "@/components/ui/card"
 import { Badge } from "@/components/ui/badge"
 import { Button } from "@/components/ui/button"
-import type { Item } from "@/lib/api"
+import { thumbnailUrl, type Item } from "@/lib/api"
 
 interface ItemCardProps {
   item: Item
@@ -17,8 +17,13 @@ export function ItemCard({ item }: ItemCardProps) {
       <Link href={`/item/${item.id}`}>
         <div className="aspect-[3/4] overflow-hidden bg-muted">
           <img
-            src={item.image_url || `/placeholder.svg?height=400&width=300&query=${encodeURIComponent(item.name)}`}
+            src={
+              thumbnailUrl(item.image_url) ||
+              `/placeholder.svg?height=400&width=300&query=${encodeURIComponent(item.name)}`
+            }
             alt={item.name}
+            loading="lazy"
+            decoding="async"
             className="h-full w-full object-cover transition-transform group-hover:scale-105"
           />
         </div>